@@ -1,21 +1,50 @@
 import json
+import os
+from typing import Optional
+
 import flask
 from flask import Response
-from flasgger import Swagger
-from simple_calendar_service.controller.event_controller import events_page
 
-app = flask.Flask(__name__)
-app.config["SWAGGER"] = {
-    "title": "Simple Calendar Service",
-    "uiversion": 3,
-    "openapi": "3.0.2",
-}
-app.config["DEBUG"] = True
-app.register_blueprint(events_page)
-swagger = Swagger(app)
+from simple_calendar_service.metrics import METRICS
+
+SWAGGER_ENABLED = os.getenv("SWAGGER_ENABLED", "true").lower() == "true"
+SWAGGER_SPEC_CACHE = os.getenv("SWAGGER_SPEC_CACHE")
+
+
+def create_app(
+    docs_enabled: Optional[bool] = None, spec_cache_path: Optional[str] = None
+) -> flask.Flask:
+    """
+    Application factory - flasgger (and the jsonschema/apispec/yaml/mistune stack it pulls in) is only imported when
+    API docs are enabled
+    :param docs_enabled: serve Swagger UI and the OpenAPI spec, defaults to SWAGGER_ENABLED
+    :param spec_cache_path: directory to cache the generated OpenAPI spec in, defaults to SWAGGER_SPEC_CACHE
+    :return:
+    """
+    from simple_calendar_service.controller.event_controller import events_page
+    from simple_calendar_service.controller.profiling_controller import profiling_page
+
+    if docs_enabled is None:
+        docs_enabled = SWAGGER_ENABLED
+
+    if spec_cache_path is None:
+        spec_cache_path = SWAGGER_SPEC_CACHE
+
+    app = flask.Flask(__name__)
+    app.config["DEBUG"] = True
+    app.register_blueprint(events_page)
+    app.register_blueprint(profiling_page)
+    app.add_url_rule("/health", view_func=health, methods=["GET"])
+    app.add_url_rule("/metrics", view_func=metrics, methods=["GET"])
+
+    if docs_enabled:
+        from simple_calendar_service.docs.swagger import init_swagger
+
+        init_swagger(app, spec_cache_path=spec_cache_path)
+
+    return app
 
 
-@app.route("/health", methods=["GET"])
 def health():
     """
     ---
@@ -35,5 +64,25 @@ def health():
     )
 
 
+def metrics():
+    """
+    ---
+    summary: In-process service metrics
+    tags:
+        - System
+    responses:
+        200:
+            content:
+                application/json:
+                    schema:
+                        type: object
+
+    """
+    return Response(response=json.dumps(METRICS.snapshot()), status=200)
+
+
+app = create_app()
+
+
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,176 @@
+"""
+Import-time benchmark for the app module, based on `python -X importtime`.
+
+Usage (from the repository root):
+
+    python benchmarks/import_time.py [--top N] [--repeat N] [--baseline REF]
+
+Each scenario imports `app` in a fresh interpreter and reports the cumulative import time of the app module along with
+the most expensive top-level packages. The baseline scenario imports the app as it was before the create_app factory,
+from a copy of the tree at REF, so the saving is measured on the same machine in the same run. Scenarios are run
+round-robin rather than one after another, so drift in machine load affects all of them alike. The checked-in report
+lives in benchmarks/import_time_report.txt.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "docs enabled (SWAGGER_ENABLED=true)": {"SWAGGER_ENABLED": "true"},
+    "docs disabled (SWAGGER_ENABLED=false)": {"SWAGGER_ENABLED": "false"},
+}
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def default_baseline_ref() -> str:
+    """
+    :return: parent of the commit which introduced create_app, i.e. the last revision of the eager app.py
+    """
+    commits = subprocess.run(
+        ["git", "log", "--format=%h", "--reverse", "-S", "def create_app", "--", "app.py"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+
+    return f"{commits[0]}~1"
+
+
+def export_tree(ref: str, directory: str):
+    archive = os.path.join(directory, "tree.tar")
+    subprocess.run(["git", "archive", "-o", archive, ref], cwd=REPO_ROOT, check=True)
+
+    with tarfile.open(archive) as tar:
+        tar.extractall(directory)
+
+
+def run_import_time(env_overrides: Dict[str, str], cwd: str = REPO_ROOT) -> List[Tuple[str, int, int]]:
+    """
+    Import app in a fresh interpreter with -X importtime
+    :param env_overrides: environment variables to set for the interpreter
+    :param cwd: tree to import app from
+    :return: list of (module, cumulative microseconds, nesting depth)
+    """
+    env = {**os.environ, **env_overrides}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    modules = []
+    for line in completed.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            _, cumulative, indent, module = match.groups()
+            modules.append((module, int(cumulative), (len(indent) - 1) // 2))
+
+    return modules
+
+
+def summarise(modules: List[Tuple[str, int, int]]) -> Tuple[int, Dict[str, int]]:
+    """
+    :param modules:
+    :return: cumulative import time of app, and of each of its direct imports
+    """
+    app_index = next(index for index, (module, _, _) in enumerate(modules) if module == "app")
+    total = modules[app_index][1]
+
+    # -X importtime prints children before their parent, so app's direct imports (including those made lazily by
+    # create_app) are the depth 1 entries immediately preceding it
+    top_level = {}
+    for module, cumulative, depth in reversed(modules[:app_index]):
+        if depth == 0:
+            break
+        if depth == 1:
+            top_level[module] = cumulative
+
+    return total, top_level
+
+
+def quartiles(values: List[float]) -> Tuple[float, float, float]:
+    if len(values) < 2:
+        return values[0], values[0], values[0]
+
+    lower, median, upper = statistics.quantiles(values, n=4)
+    return lower, median, upper
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--top", type=int, default=8, help="number of top-level imports to report")
+    parser.add_argument("--repeat", type=int, default=30, help="number of runs per scenario")
+    parser.add_argument(
+        "--baseline",
+        default=None,
+        help="git revision of the eager app.py to compare against, defaults to the parent of the create_app commit",
+    )
+    args = parser.parse_args()
+
+    baseline_ref = args.baseline or default_baseline_ref()
+
+    with tempfile.TemporaryDirectory() as baseline_tree:
+        export_tree(baseline_ref, baseline_tree)
+
+        scenarios: Dict[str, Tuple[Dict[str, str], str]] = {
+            f"baseline, eager app.py ({baseline_ref})": ({}, baseline_tree),
+            **{name: (env_overrides, REPO_ROOT) for name, env_overrides in SCENARIOS.items()},
+        }
+
+        totals: Dict[str, List[int]] = defaultdict(list)
+        breakdowns: Dict[str, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(list))
+
+        # Warm the filesystem cache and .pyc files so the first scenario isn't penalised
+        for env_overrides, cwd in scenarios.values():
+            run_import_time(env_overrides, cwd)
+
+        for _ in range(args.repeat):
+            for name, (env_overrides, cwd) in scenarios.items():
+                total, top_level = summarise(run_import_time(env_overrides, cwd))
+                totals[name].append(total / 1000)
+                for module, cumulative in top_level.items():
+                    breakdowns[name][module].append(cumulative / 1000)
+
+    print(
+        f"python {sys.version.split()[0]}, {args.repeat} interleaved runs per scenario, times in ms, "
+        f"medians with interquartile range\n"
+    )
+
+    baseline_median: Optional[float] = None
+    for name in scenarios:
+        lower, median, upper = quartiles(totals[name])
+        if baseline_median is None:
+            baseline_median = median
+            saving = ""
+        else:
+            saving = f", {baseline_median - median:+.1f} saved vs baseline ({(baseline_median - median) / baseline_median:+.0%})"
+
+        print(name)
+        print(f"  import app: median {median:.1f} (IQR {lower:.1f}-{upper:.1f}), min {min(totals[name]):.1f}{saving}")
+
+        medians = sorted(
+            ((module, statistics.median(times)) for module, times in breakdowns[name].items()),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        for module, median_time in medians[: args.top]:
+            print(f"    {module:<60} {median_time:>8.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import json
+import os
+from collections import defaultdict
+from functools import wraps
+from threading import Lock
+from typing import Callable, Dict, Optional, Tuple
+
+from flask import Response, request
+
+from simple_calendar_service.db.dao.event import EventDAO, QueryTimeoutError
+from simple_calendar_service.metrics import METRICS
+
+# Largest time range a single request may query, larger requests are rejected with 413
+ADMISSION_MAX_RANGE_DAYS = float(os.getenv("ADMISSION_MAX_RANGE_DAYS", 366))
+# Largest time range a single export may stream, exports are meant for bulk reads so allow larger ranges
+ADMISSION_MAX_EXPORT_RANGE_DAYS = float(os.getenv("ADMISSION_MAX_EXPORT_RANGE_DAYS", 3660))
+# Largest number of events a single request may read, estimated with a bounded count query. 0 disables the estimate
+ADMISSION_MAX_EVENTS = int(os.getenv("ADMISSION_MAX_EVENTS", 0))
+# Range queries a single client may have in flight, further requests are rejected with 429
+ADMISSION_MAX_CONCURRENT_PER_CLIENT = int(os.getenv("ADMISSION_MAX_CONCURRENT_PER_CLIENT", 4))
+# Total days of time range a single client may have in flight, further requests are rejected with 429
+ADMISSION_MAX_INFLIGHT_DAYS_PER_CLIENT = float(os.getenv("ADMISSION_MAX_INFLIGHT_DAYS_PER_CLIENT", 732))
+# Range queries the whole process may have in flight, across all clients, further requests are rejected with 503
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", 32))
+# Total days of time range the whole process may have in flight, further requests are rejected with 503
+ADMISSION_MAX_INFLIGHT_DAYS = float(os.getenv("ADMISSION_MAX_INFLIGHT_DAYS", 7320))
+# Retry-After returned with 429 and 503 responses
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", 1))
+# Clients choose their own X-Client-Id, so it's only used to identify them when set by a trusted gateway
+ADMISSION_TRUST_CLIENT_ID_HEADER = os.getenv("ADMISSION_TRUST_CLIENT_ID_HEADER", "false").lower() == "true"
+# Number of reverse proxies in front of the service, whose X-Forwarded-For entries identify the client. 0 uses the
+# remote address of the connection
+ADMISSION_TRUSTED_PROXY_HOPS = int(os.getenv("ADMISSION_TRUSTED_PROXY_HOPS", 0))
+
+CLIENT_ID_HEADER = "X-Client-Id"
+
+
+class AdmissionController:
+    """
+    Tracks the range queries in flight, enforcing concurrency and size budgets for each client and for the whole
+    process. The process-wide budget bounds the load when clients can't be told apart, e.g. behind a proxy
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._inflight_requests: Dict[str, int] = defaultdict(int)
+        self._inflight_days: Dict[str, float] = defaultdict(float)
+        self._total_inflight_requests = 0
+        self._total_inflight_days = 0.0
+
+    def try_acquire(self, client_id: str, days: float) -> Optional[Tuple[str, str]]:
+        """
+        :param client_id:
+        :param days: width of the requested time range
+        :return: budget which rejected the request, global_budget or client_budget, and the reason it was rejected,
+        or None if it was admitted and must later be released
+        """
+        with self._lock:
+            if self._total_inflight_requests >= ADMISSION_MAX_CONCURRENT:
+                return "global_budget", "Service is at its limit of concurrent requests"
+
+            if (
+                self._total_inflight_requests
+                and self._total_inflight_days + days > ADMISSION_MAX_INFLIGHT_DAYS
+            ):
+                return "global_budget", "Service is at its limit of concurrently requested days of events"
+
+            if self._inflight_requests[client_id] >= ADMISSION_MAX_CONCURRENT_PER_CLIENT:
+                return (
+                    "client_budget",
+                    f"Too many concurrent requests, at most {ADMISSION_MAX_CONCURRENT_PER_CLIENT} are allowed",
+                )
+
+            if (
+                self._inflight_requests[client_id]
+                and self._inflight_days[client_id] + days > ADMISSION_MAX_INFLIGHT_DAYS_PER_CLIENT
+            ):
+                return (
+                    "client_budget",
+                    f"Too many days of events requested concurrently, at most {ADMISSION_MAX_INFLIGHT_DAYS_PER_CLIENT:g} are allowed",
+                )
+
+            self._inflight_requests[client_id] += 1
+            self._inflight_days[client_id] += days
+            self._total_inflight_requests += 1
+            self._total_inflight_days += days
+
+        return None
+
+    def release(self, client_id: str, days: float):
+        with self._lock:
+            self._inflight_requests[client_id] -= 1
+            self._inflight_days[client_id] -= days
+            self._total_inflight_requests -= 1
+            self._total_inflight_days -= days
+
+            if not self._inflight_requests[client_id]:
+                del self._inflight_requests[client_id]
+                del self._inflight_days[client_id]
+
+
+ADMISSION = AdmissionController()
+
+
+def get_client_id() -> str:
+    """
+    Identify the client a request's budget is charged to - X-Client-Id only if ADMISSION_TRUST_CLIENT_ID_HEADER is
+    set, otherwise the client address, read from X-Forwarded-For when behind ADMISSION_TRUSTED_PROXY_HOPS proxies
+    :return:
+    """
+    if ADMISSION_TRUST_CLIENT_ID_HEADER and request.headers.get(CLIENT_ID_HEADER):
+        return request.headers[CLIENT_ID_HEADER]
+
+    if ADMISSION_TRUSTED_PROXY_HOPS:
+        # Each proxy appends the address it received the request from, so only the last hops entries are trustworthy
+        forwarded_for = [
+            address.strip() for address in request.headers.get("X-Forwarded-For", "").split(",") if address.strip()
+        ]
+        if len(forwarded_for) >= ADMISSION_TRUSTED_PROXY_HOPS:
+            return forwarded_for[-ADMISSION_TRUSTED_PROXY_HOPS]
+
+    return request.remote_addr or "unknown"
+
+
+def _reject(status: int, message: str, reason: str, retry_after: bool = True) -> Response:
+    METRICS.increment("admission_rejected_total", reason=reason)
+
+    return Response(
+        response=json.dumps({"message": message}),
+        status=status,
+        headers={"Retry-After": str(ADMISSION_RETRY_AFTER_SECONDS)} if retry_after else None,
+    )
+
+
+def admission_controlled(
+    count_events: Optional[Callable[[Optional[str], Optional[str], int], int]] = None,
+    max_range_days: Optional[Callable[[], float]] = None,
+    weigh_range: bool = True,
+):
+    """
+    Decorator admitting range query views by their estimated cost, read from the from_time and to_time query
+    parameters. Requests over the size budget are rejected with 413, requests over their client's concurrency budget
+    with 429, and requests over the process-wide budget or whose queries time out with 503. Streamed responses hold
+    their budget until the stream is closed
+    :param count_events: function counting events between from_time and to_time, up to a limit, used to estimate
+    the number of events a request reads when ADMISSION_MAX_EVENTS is set
+    :param max_range_days: largest time range a request may query, defaults to ADMISSION_MAX_RANGE_DAYS. Read on each
+    request so configuration changes take effect
+    :param weigh_range: charge the width of the time range to the budgets. Views whose cost doesn't grow with the
+    range, e.g. paginated searches, only use concurrency slots and parse their own time range
+    :return:
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            from_time = request.args.get("from_time")
+            to_time = request.args.get("to_time")
+
+            days = 0.0
+            if weigh_range:
+                try:
+                    from_time_datetime, to_time_datetime = EventDAO.get_time_ranges(from_time, to_time)
+                except ValueError as e:
+                    return Response(
+                        response=json.dumps({"message": f"Error parsing from_time or to_time: {str(e)}"}),
+                        status=400,
+                    )
+
+                days = max((to_time_datetime - from_time_datetime).total_seconds(), 0) / 86400
+                range_limit = max_range_days() if max_range_days else ADMISSION_MAX_RANGE_DAYS
+
+                if days > range_limit:
+                    return _reject(
+                        413,
+                        f"Requested time range of {days:.1f} days is too large, split it into ranges of at most {range_limit:g} days",
+                        reason="range",
+                        retry_after=False,
+                    )
+
+            client_id = get_client_id()
+            rejection = ADMISSION.try_acquire(client_id, days)
+            if rejection:
+                budget, message = rejection
+                return _reject(503 if budget == "global_budget" else 429, message, reason=budget)
+
+            release_on_close = False
+            try:
+                if weigh_range and ADMISSION_MAX_EVENTS and count_events:
+                    estimated_events = count_events(from_time, to_time, ADMISSION_MAX_EVENTS + 1)
+                    if estimated_events > ADMISSION_MAX_EVENTS:
+                        return _reject(
+                            413,
+                            f"Requested time range holds more than {ADMISSION_MAX_EVENTS} events, split it into smaller ranges",
+                            reason="events",
+                            retry_after=False,
+                        )
+
+                response = view(*args, **kwargs)
+
+                if isinstance(response, Response) and response.is_streamed:
+                    # The query runs while the response streams, so keep its budget until then
+                    response.call_on_close(lambda: ADMISSION.release(client_id, days))
+                    release_on_close = True
+
+                return response
+            except QueryTimeoutError as e:
+                return _reject(503, f"Query took too long, retry later or use a smaller range: {str(e)}", reason="timeout")
+            finally:
+                if not release_on_close:
+                    ADMISSION.release(client_id, days)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,157 @@
+import os
+import time
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from flask import Response, request
+
+from simple_calendar_service.controller.export import is_installed
+from simple_calendar_service.metrics import METRICS
+
+# Optional dependencies, checked without importing them so they're only loaded once a client negotiates them
+ZSTANDARD_INSTALLED = is_installed("zstandard")
+BROTLI_INSTALLED = is_installed("brotli")
+
+# Responses smaller than this many bytes are sent uncompressed, as the saving doesn't justify the CPU cost
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", 6))
+
+
+class _BrotliCompressor:
+    """
+    Adapts brotli.Compressor to the compress/flush interface shared by zlib and zstandard
+    """
+
+    def __init__(self):
+        import brotli
+
+        self.compressor = brotli.Compressor(quality=min(COMPRESSION_LEVEL, 11))
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self.compressor.finish()
+
+
+def _gzip_compressor():
+    # wbits=31 produces a gzip container rather than a raw zlib stream
+    return zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+
+
+def _zstd_compressor():
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compressobj()
+
+
+def available_encodings() -> Dict[str, Callable]:
+    """
+    Supported content codings in order of server preference, zstd and br are only offered if their libraries are
+    installed
+    :return: mapping of content coding to a factory for a streaming compressor
+    """
+    encodings = {}
+    if ZSTANDARD_INSTALLED:
+        encodings["zstd"] = _zstd_compressor
+    if BROTLI_INSTALLED:
+        encodings["br"] = _BrotliCompressor
+    encodings["gzip"] = _gzip_compressor
+
+    return encodings
+
+
+def negotiate_encoding() -> Optional[str]:
+    """
+    Select the best content coding supported by both client (via Accept-Encoding) and server
+    :return: content coding, or None if the response should be sent uncompressed
+    """
+    return request.accept_encodings.best_match(list(available_encodings()))
+
+
+def _record_metrics(encoding: str, bytes_in: int, bytes_out: int, cpu_seconds: float):
+    METRICS.increment("compression_responses_total", encoding=encoding)
+    METRICS.increment("compression_bytes_in_total", bytes_in, encoding=encoding)
+    METRICS.increment("compression_bytes_out_total", bytes_out, encoding=encoding)
+    METRICS.increment("compression_cpu_seconds_total", cpu_seconds, encoding=encoding)
+
+    total_out = METRICS.get("compression_bytes_out_total", encoding=encoding)
+    if total_out:
+        METRICS.set(
+            "compression_ratio",
+            METRICS.get("compression_bytes_in_total", encoding=encoding) / total_out,
+            encoding=encoding,
+        )
+
+
+def _compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    compressor = available_encodings()[encoding]()
+    bytes_in = bytes_out = 0
+    cpu_seconds = 0.0
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+
+            start = time.thread_time()
+            compressed = compressor.compress(chunk)
+            cpu_seconds += time.thread_time() - start
+
+            bytes_in += len(chunk)
+            bytes_out += len(compressed)
+            if compressed:
+                yield compressed
+
+        start = time.thread_time()
+        compressed = compressor.flush()
+        cpu_seconds += time.thread_time() - start
+
+        bytes_out += len(compressed)
+        yield compressed
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+        _record_metrics(encoding, bytes_in, bytes_out, cpu_seconds)
+
+
+def compress_response(response: Response) -> Response:
+    """
+    after_request hook compressing responses according to the request's Accept-Encoding. Buffered responses are only
+    compressed above COMPRESSION_MIN_SIZE, streamed responses are compressed chunk by chunk as their size is unknown
+    :param response:
+    :return:
+    """
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 304)
+        or "Content-Encoding" in response.headers
+        or response.direct_passthrough
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    encoding = negotiate_encoding()
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+
+    compressor = available_encodings()[encoding]()
+    start = time.thread_time()
+    compressed = compressor.compress(data) + compressor.flush()
+    _record_metrics(encoding, len(data), len(compressed), time.thread_time() - start)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+
+    return response
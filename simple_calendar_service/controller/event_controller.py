@@ -2,23 +2,77 @@ import json
 import os
 import re
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 from flask import request, Response, Blueprint
-from pydantic.json import pydantic_encoder
-from simple_calendar_service.db.dao.event import EventDAO
+from simple_calendar_service.controller import admission
+from simple_calendar_service.controller.admission import admission_controlled
+from simple_calendar_service.controller.compression import compress_response
+from simple_calendar_service.controller.export import available_formats, negotiate_format
+from simple_calendar_service.controller.profiling_controller import (
+    profile_request_start,
+    profile_streamed_response,
+    profile_request_end,
+)
+from simple_calendar_service.db.dao.event import EventDAO, QueryTimeoutError
+from simple_calendar_service.db.dao.write_coalescer import WriteQueueFullError
+from simple_calendar_service.db.mongodb_client import InvalidCausalTokenError
 from simple_calendar_service.dto.event import Event
 
+
+def pydantic_encoder(obj):
+    # pydantic.json pulls in pydantic.color and pydantic.types, so it's imported on first use rather than at start-up
+    from pydantic.json import pydantic_encoder as encoder
+
+    return encoder(obj)
+
+
 events_page = Blueprint(
     "events_page",
     __name__,
 )
+events_page.after_request(compress_response)
+events_page.before_request(profile_request_start)
+events_page.after_request(profile_streamed_response)
+events_page.teardown_request(profile_request_end)
 
 MONGODB_EVENTS_COLLECTION_NAME = os.getenv("MONGODB_EVENTS_COLLECTION_NAME")
 MONGODB_DATABASE = os.getenv("MONGODB_DATABASE")
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 10000))
+# Exports stream far more events than other range queries, so get a separate, longer, time limit
+EXPORT_MAX_TIME_MS = int(os.getenv("EXPORT_MAX_TIME_MS", 300000))
+# Server-side time limit for range and search queries
+MONGODB_QUERY_MAX_TIME_MS = int(os.getenv("MONGODB_QUERY_MAX_TIME_MS", 30000))
+SEARCH_DEFAULT_PAGE_SIZE = int(os.getenv("SEARCH_DEFAULT_PAGE_SIZE", 20))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", 100))
+# Deepest result a search may page to, as each partition or shard reads every result up to the requested page
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", 1000))
+# Returned by POST /events when reads are routed to secondaries, sending it back on later requests guarantees they
+# observe the write
+CAUSAL_TOKEN_HEADER = "X-Causal-Token"
 
 DAO = EventDAO
 
 
+def get_causal_token() -> Optional[str]:
+    """
+    :return: the request's causal token, validated so a malformed one is rejected before any query runs
+    :raises InvalidCausalTokenError:
+    """
+    causal_token = request.headers.get(CAUSAL_TOKEN_HEADER)
+    if causal_token:
+        EventDAO.validate_causal_token(causal_token)
+
+    return causal_token
+
+
+@events_page.errorhandler(InvalidCausalTokenError)
+def invalid_causal_token(e: InvalidCausalTokenError):
+    return Response(
+        response=json.dumps({"message": f"Invalid {CAUSAL_TOKEN_HEADER} header: {str(e)}"}),
+        status=400,
+    )
+
+
 @events_page.route("/events", methods=["POST"])
 def create_events():
     """
@@ -48,6 +102,11 @@ def create_events():
             content:
                 application/json:
                     schema: Error
+        503:
+            description: Too many pending writes
+            content:
+                application/json:
+                    schema: Error
     """
     json_body = request.get_json()
 
@@ -62,12 +121,14 @@ def create_events():
                 )
             )
 
-        res: Dict[str, List[Event]] = DAO(
+        dao = DAO(
             database=MONGODB_DATABASE,
-            collection=MONGODB_EVENTS_COLLECTION_NAME
-        ).create_events(events=events)
+            collection=MONGODB_EVENTS_COLLECTION_NAME,
+            causal_token=get_causal_token(),
+        )
+        res: Dict[str, List[Event]] = dao.create_events(events=events)
 
-        return Response(
+        response = Response(
             response=json.dumps(
                 {
                     "createdEvents": res["created"],
@@ -79,6 +140,11 @@ def create_events():
             status=200,
         )
 
+        if dao.causal_token:
+            response.headers[CAUSAL_TOKEN_HEADER] = dao.causal_token
+
+        return response
+
     except KeyError as e:
         return Response(
             response=json.dumps(
@@ -88,6 +154,12 @@ def create_events():
             ),
             status=400,
         )
+    except WriteQueueFullError as e:
+        return Response(
+            response=json.dumps({"message": f"Too many pending writes, retry later: {str(e)}"}),
+            status=503,
+            headers={"Retry-After": "1"},
+        )
 
 
 @events_page.route("/event/<int:id>", methods=["GET"])
@@ -135,7 +207,8 @@ def get_event_by_id(id: int):
     try:
         res: Event = DAO(
             database=MONGODB_DATABASE,
-            collection=MONGODB_EVENTS_COLLECTION_NAME
+            collection=MONGODB_EVENTS_COLLECTION_NAME,
+            causal_token=get_causal_token(),
         ).get_event_by_id(id=id)
 
         if not res:
@@ -166,7 +239,18 @@ def get_event_by_id(id: int):
         )
 
 
+def count_events_by_time_range(from_time: Optional[str], to_time: Optional[str], limit: int) -> int:
+    return DAO(
+        database=MONGODB_DATABASE,
+        collection=MONGODB_EVENTS_COLLECTION_NAME,
+        causal_token=get_causal_token(),
+    ).count_events_by_time_range(
+        from_time, to_time, limit=limit, max_time_ms=MONGODB_QUERY_MAX_TIME_MS
+    )
+
+
 @events_page.route("/events", methods=["GET"])
+@admission_controlled(count_events=count_events_by_time_range)
 def get_events_by_time_range():
     """
     Get calendar events by date range.
@@ -194,6 +278,12 @@ def get_events_by_time_range():
           required: false
           schema:
             type: string
+        - in: header
+          name: X-Client-Id
+          description: identifies the client for per-client concurrency and size budgets, only used when ADMISSION_TRUST_CLIENT_ID_HEADER is set, defaults to the remote address
+          required: false
+          schema:
+            type: string
     responses:
         200:
             description: OK
@@ -202,6 +292,21 @@ def get_events_by_time_range():
             content:
                 application/json:
                     schema: Error
+        413:
+            description: Requested time range is too large, split it into smaller ranges
+            content:
+                application/json:
+                    schema: Error
+        429:
+            description: Client has too many requests in flight, retry after the Retry-After header
+            content:
+                application/json:
+                    schema: Error
+        503:
+            description: Query timed out or the service has too many requests in flight, retry after the Retry-After header
+            content:
+                application/json:
+                    schema: Error
     """
 
     datetime_format = request.args.get("datetime_format")
@@ -211,8 +316,11 @@ def get_events_by_time_range():
     try:
         res: List[Event] = DAO(
             database=MONGODB_DATABASE,
-            collection=MONGODB_EVENTS_COLLECTION_NAME
-        ).get_events_by_time_range(from_time, to_time)
+            collection=MONGODB_EVENTS_COLLECTION_NAME,
+            causal_token=get_causal_token(),
+        ).get_events_by_time_range(
+            from_time, to_time, max_time_ms=MONGODB_QUERY_MAX_TIME_MS
+        )
 
         if not res:
             return Response(
@@ -240,3 +348,268 @@ def get_events_by_time_range():
             ),
             status=422,
         )
+
+
+@events_page.route("/events/export", methods=["GET"])
+@admission_controlled(max_range_days=lambda: admission.ADMISSION_MAX_EXPORT_RANGE_DAYS)
+def export_events_by_time_range():
+    """
+    Export calendar events by date range in a binary columnar format.
+    ---
+    summary: Export calendar events by date range in a binary columnar format.
+    description: Streams all events falling within a date range for bulk reads. The format is selected by the Accept header, either an Arrow IPC stream (application/vnd.apache.arrow.stream) or a sequence of MessagePack maps (application/msgpack). Events are sent in batches of columns id, description and time, where time is int64 epoch milliseconds. The date range defaults to "today" at 00:00:00 to now.
+    tags:
+        - Event
+    parameters:
+        - in: query
+          name: from_time
+          description: lower date range boundary
+          required: false
+          schema:
+            type: string
+        - in: query
+          name: to_time
+          description: upper date range boundary
+          required: false
+          schema:
+            type: string
+    responses:
+        200:
+            description: OK
+            content:
+                application/vnd.apache.arrow.stream:
+                    schema:
+                        type: string
+                        format: binary
+                application/msgpack:
+                    schema:
+                        type: string
+                        format: binary
+        400:
+            description: Invalid from_time or to_time
+            content:
+                application/json:
+                    schema: Error
+        406:
+            description: None of the accepted formats are supported
+            content:
+                application/json:
+                    schema: Error
+        413:
+            description: Requested time range is too large, split it into smaller ranges
+            content:
+                application/json:
+                    schema: Error
+        429:
+            description: Client has too many requests in flight, retry after the Retry-After header
+            content:
+                application/json:
+                    schema: Error
+        503:
+            description: The service has too many requests in flight, retry after the Retry-After header
+            content:
+                application/json:
+                    schema: Error
+    """
+    mimetype = negotiate_format()
+
+    if not mimetype:
+        return Response(
+            response=json.dumps(
+                {
+                    "message": f"Unable to export events in an accepted format, supported formats are: {', '.join(available_formats())}"
+                }
+            ),
+            status=406,
+        )
+
+    try:
+        batches = DAO(
+            database=MONGODB_DATABASE,
+            collection=MONGODB_EVENTS_COLLECTION_NAME,
+            causal_token=get_causal_token(),
+        ).get_event_batches_by_time_range(
+            request.args.get("from_time"),
+            request.args.get("to_time"),
+            batch_size=EXPORT_BATCH_SIZE,
+            max_time_ms=EXPORT_MAX_TIME_MS,
+        )
+    except ValueError as e:
+        return Response(
+            response=json.dumps(
+                {"message": f"Error parsing from_time or to_time: {str(e)}"}
+            ),
+            status=400,
+        )
+
+    return Response(
+        response=available_formats()[mimetype](batches),
+        mimetype=mimetype,
+        status=200,
+    )
+
+
+@events_page.route("/events/search", methods=["GET"])
+@admission_controlled(weigh_range=False)
+def search_events():
+    """
+    Search calendar events by description.
+    ---
+    summary: Search calendar events by description.
+    description: Returns events whose description matches any of the search terms, ranked by relevance and paginated. The search can be limited to a date range with the optional from_time and to_time query parameters, which are unbounded by default.
+    tags:
+        - Event
+    parameters:
+        - in: query
+          name: q
+          description: search terms
+          required: true
+          schema:
+            type: string
+        - in: query
+          name: from_time
+          description: lower date range boundary
+          required: false
+          schema:
+            type: string
+        - in: query
+          name: to_time
+          description: upper date range boundary
+          required: false
+          schema:
+            type: string
+        - in: query
+          name: page
+          description: page number, starting at 1, pages past the first 1000 results are rejected
+          required: false
+          schema:
+            type: integer
+        - in: query
+          name: page_size
+          description: number of events per page, at most 100
+          required: false
+          schema:
+            type: integer
+        - in: query
+          name: datetime_format
+          description:  Date-time format for parsing/printing of dates. Compatible with strptime/strftime format specification. The default value for this argument is %Y-%m-%dT%H:%M:%S, e.g. 2024-01-01T00:00:00.
+          required: false
+          schema:
+            type: string
+    responses:
+        200:
+            description: OK
+        400:
+            description: Missing search terms, invalid pagination or date range, or a page past the searchable results
+            content:
+                application/json:
+                    schema: Error
+        422:
+            description: Invalid datetime_format
+            content:
+                application/json:
+                    schema: Error
+        429:
+            description: Client has too many requests in flight, retry after the Retry-After header
+            content:
+                application/json:
+                    schema: Error
+        503:
+            description: Search timed out or the service has too many requests in flight
+            content:
+                application/json:
+                    schema: Error
+    """
+    query = request.args.get("q", "").strip()
+    datetime_format = request.args.get("datetime_format")
+
+    if not query:
+        return Response(
+            response=json.dumps({"message": "Query parameter q is required"}),
+            status=400,
+        )
+
+    page = request.args.get("page", 1, type=int)
+    page_size = request.args.get("page_size", SEARCH_DEFAULT_PAGE_SIZE, type=int)
+
+    if page < 1 or not 1 <= page_size <= SEARCH_MAX_PAGE_SIZE:
+        return Response(
+            response=json.dumps(
+                {
+                    "message": f"page must be at least 1 and page_size between 1 and {SEARCH_MAX_PAGE_SIZE}"
+                }
+            ),
+            status=400,
+        )
+
+    if page * page_size > SEARCH_MAX_RESULTS:
+        return Response(
+            response=json.dumps(
+                {
+                    "message": f"Only the first {SEARCH_MAX_RESULTS} results can be paged through, narrow the search instead"
+                }
+            ),
+            status=400,
+        )
+
+    from_time = request.args.get("from_time")
+    to_time = request.args.get("to_time")
+
+    try:
+        EventDAO.get_optional_time_ranges(from_time, to_time)
+    except ValueError as e:
+        return Response(
+            response=json.dumps(
+                {"message": f"Error parsing from_time or to_time: {str(e)}"}
+            ),
+            status=400,
+        )
+
+    try:
+        res, has_more = DAO(
+            database=MONGODB_DATABASE,
+            collection=MONGODB_EVENTS_COLLECTION_NAME,
+            causal_token=get_causal_token(),
+        ).search_events(
+            query,
+            from_time,
+            to_time,
+            page=page,
+            page_size=page_size,
+            max_time_ms=MONGODB_QUERY_MAX_TIME_MS,
+        )
+
+        results = [
+            {**event.format_time(datetime_format), "score": score} for event, score in res
+        ]
+
+        return Response(
+            response=json.dumps(
+                {
+                    "results": results,
+                    "page": page,
+                    "pageSize": page_size,
+                    "hasMore": has_more,
+                    "message": "Successfully searched events",
+                },
+                default=pydantic_encoder,
+            ),
+            status=200,
+        )
+    except re.error:
+        return Response(
+            response=json.dumps(
+                {
+                    "message": f"Error formatting retrieved record with the specified datetime_format: {datetime_format}"
+                }
+            ),
+            status=422,
+        )
+    except QueryTimeoutError as e:
+        return Response(
+            response=json.dumps(
+                {"message": f"Search took too long, retry later or use a smaller range: {str(e)}"}
+            ),
+            status=503,
+            headers={"Retry-After": "1"},
+        )
@@ -0,0 +1,92 @@
+import importlib.util
+import io
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from flask import request
+
+ARROW_STREAM_MIMETYPE = "application/vnd.apache.arrow.stream"
+MSGPACK_MIMETYPE = "application/msgpack"
+MSGPACK_LEGACY_MIMETYPE = "application/x-msgpack"
+
+
+def encode_arrow(batches: Iterable[Dict[str, List[Any]]]) -> Iterator[bytes]:
+    """
+    Encode column batches as an Arrow IPC stream, one record batch per column batch. Times are written as
+    timestamp[ms], i.e. int64 epoch milliseconds
+    :param batches:
+    :return:
+    """
+    import pyarrow
+    import pyarrow.ipc
+
+    schema = pyarrow.schema(
+        [
+            pyarrow.field("id", pyarrow.int64(), nullable=False),
+            pyarrow.field("description", pyarrow.string()),
+            pyarrow.field("time", pyarrow.timestamp("ms"), nullable=False),
+        ]
+    )
+    sink = io.BytesIO()
+
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        yield drain()
+
+        for batch in batches:
+            writer.write_batch(pyarrow.record_batch(batch, schema=schema))
+            yield drain()
+
+    yield drain()
+
+
+def encode_msgpack(batches: Iterable[Dict[str, List[Any]]]) -> Iterator[bytes]:
+    """
+    Encode column batches as a sequence of MessagePack maps of column name to values, which can be read incrementally
+    with msgpack.Unpacker. Times are int64 epoch milliseconds
+    :param batches:
+    :return:
+    """
+    import msgpack
+
+    packer = msgpack.Packer()
+
+    for batch in batches:
+        yield packer.pack(batch)
+
+
+def is_installed(module: str) -> bool:
+    # Checked without importing, pyarrow in particular is too heavy to load at start-up
+    return importlib.util.find_spec(module) is not None
+
+
+def available_formats() -> Dict[str, Callable]:
+    """
+    Supported export formats in order of server preference, each is only offered if its library is installed
+    :return: mapping of mimetype to encoder
+    """
+    formats = {}
+    if is_installed("pyarrow"):
+        formats[ARROW_STREAM_MIMETYPE] = encode_arrow
+    if is_installed("msgpack"):
+        formats[MSGPACK_MIMETYPE] = encode_msgpack
+        formats[MSGPACK_LEGACY_MIMETYPE] = encode_msgpack
+
+    return formats
+
+
+def negotiate_format() -> Optional[str]:
+    """
+    Select the export format from the request's Accept header
+    :return: mimetype, or None if no supported format is acceptable
+    """
+    formats = list(available_formats())
+
+    if not request.accept_mimetypes:
+        return formats[0] if formats else None
+
+    return request.accept_mimetypes.best_match(formats)
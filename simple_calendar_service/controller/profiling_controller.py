@@ -0,0 +1,162 @@
+import hmac
+import json
+import os
+
+from flask import request, Response, Blueprint, abort
+
+from simple_calendar_service.db.dao.event import EventDAO
+from simple_calendar_service.db.mongodb_client import MongoDBClient
+from simple_calendar_service.db.partitioned_mongodb_client import PartitionedMongoDBClient
+from simple_calendar_service.db.sharded_mongodb_client import ShardedMongoDBClient
+from simple_calendar_service.profiling import PROFILER
+
+# Bearer token for the profiling admin endpoint, which is disabled when unset
+PROFILING_ADMIN_TOKEN = os.getenv("PROFILING_ADMIN_TOKEN")
+
+profiling_page = Blueprint(
+    "profiling_page",
+    __name__,
+)
+
+PROFILER.instrument(EventDAO)
+PROFILER.instrument(MongoDBClient)
+PROFILER.instrument(PartitionedMongoDBClient)
+PROFILER.instrument(ShardedMongoDBClient)
+
+
+def profile_request_start():
+    """
+    before_request hook, profiles the request if the profiler is armed
+    """
+    if PROFILER.active:
+        PROFILER.begin_request(f"{request.method} {request.url_rule}")
+
+
+def profile_streamed_response(response: Response) -> Response:
+    """
+    after_request hook, profiles streamed responses until they have been sent
+    """
+    if response.is_streamed and PROFILER.profiling_request:
+        PROFILER.end_request_on_close(response)
+
+    return response
+
+
+def profile_request_end(exception=None):
+    """
+    teardown_request hook
+    """
+    PROFILER.end_request()
+
+
+@profiling_page.before_request
+def authenticate():
+    if not PROFILING_ADMIN_TOKEN:
+        abort(404)
+
+    # Compared as bytes, as compare_digest rejects strings with non-ASCII characters
+    if not hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(), f"Bearer {PROFILING_ADMIN_TOKEN}".encode()
+    ):
+        return Response(
+            response=json.dumps({"message": "Invalid or missing admin token"}),
+            status=401,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@profiling_page.route("/admin/profiling", methods=["POST"])
+def start_profiling():
+    """
+    Start profiling requests to the events routes
+    ---
+    summary: Start profiling requests to the events routes.
+    description: Arms the profiler for the next N requests and/or a fraction of requests, discarding previous results. In sampler mode the stacks of profiled requests are sampled periodically, in cprofile mode requests are profiled with cProfile. Both modes record per-stage timings of EventDAO and MongoDBClient calls. Requires the PROFILING_ADMIN_TOKEN as a bearer token.
+    tags:
+        - Admin
+    requestBody:
+        required: false
+        content:
+            application/json:
+                schema:
+                    type: object
+                    properties:
+                        mode:
+                            type: string
+                            enum: [sampler, cprofile]
+                        requests:
+                            type: integer
+                        sample_rate:
+                            type: number
+    responses:
+        200:
+            description: OK
+            content:
+                application/json:
+                    schema:
+                        type: object
+        400:
+            description: Invalid profiling options
+            content:
+                application/json:
+                    schema: Error
+    """
+    options = request.get_json(silent=True) or {}
+
+    try:
+        PROFILER.start(
+            mode=options.get("mode", "sampler"),
+            requests=options.get("requests", 10 if "sample_rate" not in options else None),
+            sample_rate=float(options.get("sample_rate", 1.0)),
+        )
+    except (TypeError, ValueError) as e:
+        return Response(
+            response=json.dumps({"message": f"Invalid profiling options: {str(e)}"}),
+            status=400,
+        )
+
+    return Response(response=json.dumps(PROFILER.report()), status=200)
+
+
+@profiling_page.route("/admin/profiling", methods=["GET"])
+def get_profiling_results():
+    """
+    Get profiling results
+    ---
+    summary: Get profiling results.
+    description: Returns per-stage timings and, in cprofile mode, cProfile statistics as JSON. With format=folded, returns the sampled stacks in folded format for flamegraph.pl or speedscope.
+    tags:
+        - Admin
+    parameters:
+        - in: query
+          name: format
+          description: json (default) or folded
+          required: false
+          schema:
+            type: string
+    responses:
+        200:
+            description: OK
+    """
+    if request.args.get("format") == "folded":
+        return Response(response=PROFILER.folded(), mimetype="text/plain", status=200)
+
+    return Response(response=json.dumps(PROFILER.report()), status=200)
+
+
+@profiling_page.route("/admin/profiling", methods=["DELETE"])
+def stop_profiling():
+    """
+    Stop profiling
+    ---
+    summary: Stop profiling.
+    description: Disarms the profiler, returning its results.
+    tags:
+        - Admin
+    responses:
+        200:
+            description: OK
+    """
+    PROFILER.stop()
+
+    return Response(response=json.dumps(PROFILER.report()), status=200)
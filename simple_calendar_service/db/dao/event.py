@@ -1,21 +1,101 @@
+import calendar
+import os
 from datetime import datetime
-from typing import Optional, List, Dict, Any, Tuple
-from simple_calendar_service.db.mongodb_client import MongoDBClient
+from itertools import islice
+from typing import Optional, List, Dict, Any, Tuple, Iterator
+from simple_calendar_service.db.dao.write_coalescer import (
+    WRITE_COALESCE_WINDOW_MS,
+    WriteCoalescer,
+    get_write_coalescer,
+)
+from simple_calendar_service.db.mongodb_client import MongoDBClient, decode_causal_token
+from simple_calendar_service.db.partitioned_mongodb_client import (
+    MONGODB_PARTITIONING,
+    PartitionedMongoDBClient,
+)
+from simple_calendar_service.db.sharded_mongodb_client import (
+    MONGODB_SHARDS,
+    ShardedMongoDBClient,
+    decode_sharded_causal_token,
+    get_shard_clients,
+    parse_shards,
+)
 from simple_calendar_service.dto.event import Event
+from simple_calendar_service.search.inverted_index import InvertedIndex, get_inverted_index
+
+# "mongo" searches with a MongoDB text index, "memory" with a process-wide inverted index for when text indexes aren't
+# available, e.g. with mongomock. The inverted index only sees writes made by this process after it is built
+EVENT_SEARCH_BACKEND = os.getenv("EVENT_SEARCH_BACKEND", "mongo")
+
+
+class QueryTimeoutError(Exception):
+    pass
 
 
 class EventDAO:
-    def __init__(self, database, collection, client=None):
+    def __init__(
+        self, database, collection, client=None, causal_token=None, write_coalescer=None
+    ):
+        self.database = database
+        self.collection = collection
+        self.write_coalescer: Optional[WriteCoalescer] = write_coalescer
+
         if not client:
-            self.db_client: MongoDBClient = MongoDBClient(
-                database=database,
-                collection=collection
+            client_class = (
+                PartitionedMongoDBClient if MONGODB_PARTITIONING == "monthly" else MongoDBClient
             )
+            if MONGODB_SHARDS:
+                self.db_client = ShardedMongoDBClient(
+                    database=database,
+                    collection=collection,
+                    shards=get_shard_clients(parse_shards(MONGODB_SHARDS)),
+                    shard_client_class=client_class,
+                    causal_token=causal_token,
+                )
+            else:
+                self.db_client: MongoDBClient = client_class(
+                    database=database,
+                    collection=collection,
+                    causal_token=causal_token,
+                )
+            if not write_coalescer and WRITE_COALESCE_WINDOW_MS > 0:
+                self.write_coalescer = get_write_coalescer(
+                    database, collection, self.db_client
+                )
         else:
             self.db_client = client
 
+    @property
+    def causal_token(self) -> Optional[str]:
+        """
+        Token identifying this DAO's latest write, when reads are routed to secondaries. Passing it to a later DAO
+        guarantees that DAO reads the write
+        :return:
+        """
+        return self.db_client.causal_token
+
+    @staticmethod
+    def validate_causal_token(token: str):
+        """
+        Check a client supplied causal token before it's used, tokens are otherwise only decoded once a read starts
+        :param token:
+        :raises InvalidCausalTokenError: if the token is malformed
+        """
+        if MONGODB_SHARDS:
+            decode_sharded_causal_token(token)
+        else:
+            decode_causal_token(token)
+
     def create_events(self, events: List[Event]) -> Dict[str, List[Event]]:
-        res: Dict[str, Any] = self.db_client.insert_documents(events)
+        if self.write_coalescer:
+            res, causal_token = self.write_coalescer.submit(events)
+            if causal_token:
+                self.db_client.causal_token = causal_token
+        else:
+            res: Dict[str, Any] = self.db_client.insert_documents(events)
+
+        if EVENT_SEARCH_BACKEND == "memory":
+            self.get_search_index().add_documents(res["created"] + res["updated"])
 
         for category, events in res.items():
             res[category] = [Event(**event) for event in events]
@@ -23,7 +103,8 @@ class EventDAO:
         return res
 
     def get_event_by_id(self, id: int) -> Optional[Event]:
-        res = self.db_client.get_document({"id": id})
+        # Events are stored with _id set to their id, which is indexed
+        res = self.db_client.get_document({"_id": id})
 
         if not res:
             return None
@@ -31,8 +112,13 @@ class EventDAO:
         return Event(**res)
 
     def get_events_by_time_range(
-        self, from_time: Optional[str] = None, to_time: Optional[str] = None
+        self,
+        from_time: Optional[str] = None,
+        to_time: Optional[str] = None,
+        max_time_ms: Optional[int] = None,
     ) -> List[Event]:
+        from pymongo.errors import ExecutionTimeout
+
         from_time_datetime, to_time_datetime = EventDAO.get_time_ranges(
             from_time, to_time
         )
@@ -41,14 +127,187 @@ class EventDAO:
             datetime_field="time",
             datetime_lower=from_time_datetime,
             datetime_upper=to_time_datetime,
+            max_time_ms=max_time_ms,
         )
 
         events = []
-        for event in res:
-            events.append(Event(**event))
+        try:
+            for event in res:
+                events.append(Event(**event))
+        except ExecutionTimeout as e:
+            raise QueryTimeoutError(f"Query exceeded {max_time_ms}ms") from e
 
         return events
 
+    def count_events_by_time_range(
+        self,
+        from_time: Optional[str] = None,
+        to_time: Optional[str] = None,
+        limit: Optional[int] = None,
+        max_time_ms: Optional[int] = None,
+    ) -> int:
+        """
+        Count events in a time range, used to estimate the cost of reading them
+        :param from_time:
+        :param to_time:
+        :param limit: stop counting after this many events
+        :param max_time_ms:
+        :return:
+        """
+        from pymongo.errors import ExecutionTimeout
+
+        from_time_datetime, to_time_datetime = EventDAO.get_time_ranges(
+            from_time, to_time
+        )
+
+        try:
+            return self.db_client.count_documents_by_date_range(
+                datetime_field="time",
+                datetime_lower=from_time_datetime,
+                datetime_upper=to_time_datetime,
+                limit=limit,
+                max_time_ms=max_time_ms,
+            )
+        except ExecutionTimeout as e:
+            raise QueryTimeoutError(f"Count exceeded {max_time_ms}ms") from e
+
+    def get_event_batches_by_time_range(
+        self,
+        from_time: Optional[str] = None,
+        to_time: Optional[str] = None,
+        batch_size: int = 10000,
+        max_time_ms: Optional[int] = None,
+    ) -> Iterator[Dict[str, List[Any]]]:
+        """
+        Columnar alternative to get_events_by_time_range for bulk reads - documents are read from the cursor in batches
+        and returned as columns of raw values rather than Event objects, with times as int64 epoch milliseconds.
+        Time ranges are parsed eagerly so invalid input raises before any batch is consumed
+        :param from_time:
+        :param to_time:
+        :param batch_size: number of events per batch
+        :param max_time_ms: time limit for the query, exceeding it raises QueryTimeoutError while the batches are read
+        :return: iterator of {"id": [...], "description": [...], "time": [...]} batches
+        """
+        from_time_datetime, to_time_datetime = EventDAO.get_time_ranges(
+            from_time, to_time
+        )
+
+        res = self.db_client.get_documents_by_date_range(
+            datetime_field="time",
+            datetime_lower=from_time_datetime,
+            datetime_upper=to_time_datetime,
+            batch_size=batch_size,
+            max_time_ms=max_time_ms,
+        )
+
+        return EventDAO.raise_query_timeouts(EventDAO.to_column_batches(res, batch_size), max_time_ms)
+
+    @staticmethod
+    def raise_query_timeouts(batches: Iterator[Dict[str, List[Any]]], max_time_ms: Optional[int]):
+        from pymongo.errors import ExecutionTimeout
+
+        try:
+            yield from batches
+        except ExecutionTimeout as e:
+            raise QueryTimeoutError(f"Query exceeded {max_time_ms}ms") from e
+
+    def get_search_index(self) -> InvertedIndex:
+        return get_inverted_index(
+            (self.database, self.collection),
+            text_field="description",
+            datetime_field="time",
+            load_documents=self.db_client.get_all_documents,
+        )
+
+    def search_events(
+        self,
+        query: str,
+        from_time: Optional[str] = None,
+        to_time: Optional[str] = None,
+        page: int = 1,
+        page_size: int = 20,
+        max_time_ms: Optional[int] = None,
+    ) -> Tuple[List[Tuple[Event, float]], bool]:
+        """
+        Full-text search over event descriptions, ranked by relevance and paginated
+        :param query: search terms, events matching any term are returned
+        :param from_time: optional lower time range boundary
+        :param to_time: optional upper time range boundary
+        :param page: page number, starting at 1
+        :param page_size:
+        :param max_time_ms:
+        :return: events with their relevance score, and whether there are further pages
+        """
+        from pymongo.errors import ExecutionTimeout
+
+        from_time_datetime, to_time_datetime = EventDAO.get_optional_time_ranges(from_time, to_time)
+        skip = (page - 1) * page_size
+
+        # One extra result tells whether there is another page, without counting every match
+        if EVENT_SEARCH_BACKEND == "memory":
+            res = self.get_search_index().search(
+                query, from_time_datetime, to_time_datetime, skip=skip, limit=page_size + 1
+            )
+        else:
+            self.db_client.create_text_index("description")
+
+            try:
+                res = self.db_client.search_documents(
+                    query,
+                    datetime_field="time",
+                    datetime_lower=from_time_datetime,
+                    datetime_upper=to_time_datetime,
+                    skip=skip,
+                    limit=page_size + 1,
+                    max_time_ms=max_time_ms,
+                )
+            except ExecutionTimeout as e:
+                raise QueryTimeoutError(f"Search exceeded {max_time_ms}ms") from e
+
+        events = [
+            (Event(**document), document["score"])
+            for document in res[:page_size]
+        ]
+
+        return events, len(res) > page_size
+
+    @staticmethod
+    def to_column_batches(
+        documents, batch_size: int
+    ) -> Iterator[Dict[str, List[Any]]]:
+        documents = iter(documents)
+
+        while True:
+            batch = list(islice(documents, batch_size))
+            if not batch:
+                return
+
+            yield {
+                "id": [document["id"] for document in batch],
+                "description": [document.get("description") for document in batch],
+                "time": [EventDAO.to_epoch_millis(document["time"]) for document in batch],
+            }
+
+    @staticmethod
+    def to_epoch_millis(time: datetime) -> int:
+        # MongoDB stores naive datetimes as UTC
+        return calendar.timegm(time.utctimetuple()) * 1000 + time.microsecond // 1000
+
+    @staticmethod
+    def get_optional_time_ranges(
+        from_time: Optional[str], to_time: Optional[str]
+    ) -> Tuple[Optional[datetime], Optional[datetime]]:
+        """
+        Parse a time range whose boundaries are unbounded when unset, unlike get_time_ranges
+        :param from_time:
+        :param to_time:
+        :return:
+        """
+        from_time_datetime = datetime.strptime(from_time, "%Y-%m-%dT%H:%M:%S") if from_time else None
+        to_time_datetime = datetime.strptime(to_time, "%Y-%m-%dT%H:%M:%S") if to_time else None
+
+        return from_time_datetime, to_time_datetime
+
     @staticmethod
     def get_time_ranges(
         from_time: Optional[str], to_time: Optional[str]
@@ -0,0 +1,208 @@
+import atexit
+import os
+import queue
+import time
+from concurrent.futures import Future
+from threading import Lock, Thread
+from typing import Dict, Any, List, Optional, Tuple
+
+from simple_calendar_service.db.mongodb_client import MongoDBClient, PartialWriteError
+from simple_calendar_service.metrics import METRICS
+
+# Group commit - upserts from concurrent requests are collected for up to this many milliseconds and written with a
+# single bulk write. 0 disables coalescing
+WRITE_COALESCE_WINDOW_MS = float(os.getenv("WRITE_COALESCE_WINDOW_MS", 0))
+# Maximum number of records per coalesced bulk write
+WRITE_COALESCE_MAX_BATCH_SIZE = int(os.getenv("WRITE_COALESCE_MAX_BATCH_SIZE", 1000))
+# Maximum number of requests waiting to be written, further requests are rejected
+WRITE_COALESCE_MAX_QUEUE_SIZE = int(os.getenv("WRITE_COALESCE_MAX_QUEUE_SIZE", 1000))
+
+
+class WriteQueueFullError(Exception):
+    pass
+
+
+class WriteCoalescerClosedError(Exception):
+    pass
+
+
+class _PendingWrite:
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.records = records
+        self.future: Future = Future()
+
+
+_SHUTDOWN = object()
+
+
+class WriteCoalescer:
+    """
+    Collects upserts submitted by concurrent callers and writes them to MongoDB as one unordered bulk write per window,
+    giving each caller back the created/updated split for its own documents. Batches are written by a background
+    thread, callers block until the batch holding their documents has been written
+    """
+
+    def __init__(
+        self,
+        db_client: MongoDBClient,
+        window_seconds: float,
+        max_batch_size: int = WRITE_COALESCE_MAX_BATCH_SIZE,
+        max_queue_size: int = WRITE_COALESCE_MAX_QUEUE_SIZE,
+    ):
+        self.db_client = db_client
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = Lock()
+        self._closed = False
+        self._thread = Thread(target=self._run, name="write-coalescer", daemon=True)
+        self._thread.start()
+
+    def submit(self, documents: List[Any]) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        Upsert documents as part of the next coalesced bulk write
+        :param documents: objects implementing convert_to_mongodb_record
+        :return: created/updated records, in the format of MongoDBClient.insert_documents, and the causal token of the
+        write if one was issued
+        """
+        pending = _PendingWrite([document.convert_to_mongodb_record() for document in documents])
+
+        with self._lock:
+            if self._closed:
+                raise WriteCoalescerClosedError("Write coalescer has been closed")
+
+            try:
+                self._queue.put_nowait(pending)
+            except queue.Full:
+                METRICS.increment("write_coalescer_rejected_total")
+                raise WriteQueueFullError(
+                    f"Write queue is full, {self._queue.maxsize} requests are waiting to be written"
+                )
+
+        return pending.future.result()
+
+    def close(self):
+        """
+        Stop accepting writes, flush everything already queued and wait for the background thread to finish
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_SHUTDOWN)
+
+        self._thread.join()
+
+    def _run(self):
+        shutting_down = False
+
+        while not shutting_down:
+            pending = self._queue.get()
+            if pending is _SHUTDOWN:
+                break
+
+            batch = [pending]
+            batch_size = len(pending.records)
+            deadline = time.monotonic() + self.window_seconds
+
+            while batch_size < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+
+                try:
+                    pending = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+                if pending is _SHUTDOWN:
+                    shutting_down = True
+                    break
+
+                batch.append(pending)
+                batch_size += len(pending.records)
+
+            self._flush(batch)
+
+    def _flush(self, batch: List[_PendingWrite]):
+        # A document submitted more than once in a window is only written once, with its latest version
+        records_by_id = {}
+        for pending in batch:
+            for record in pending.records:
+                records_by_id[record["_id"]] = record
+
+        start = time.monotonic()
+        failed_ids = set()
+        error: Optional[PartialWriteError] = None
+        try:
+            upserted_ids = set(
+                self.db_client.upsert_records(list(records_by_id.values()), ordered=False)
+            )
+        except PartialWriteError as e:
+            # The write is unordered, so everything but the failed records was written
+            METRICS.increment("write_coalescer_partial_batches_total")
+            error = e
+            failed_ids = set(e.failed_ids)
+            upserted_ids = set(e.upserted_ids)
+        except Exception as e:
+            METRICS.increment("write_coalescer_failed_batches_total")
+            for pending in batch:
+                pending.future.set_exception(e)
+            return
+
+        METRICS.increment("write_coalescer_batches_total")
+        METRICS.increment("write_coalescer_requests_total", len(batch))
+        METRICS.increment("write_coalescer_records_total", len(records_by_id))
+        METRICS.increment("write_coalescer_write_seconds_total", time.monotonic() - start)
+
+        causal_token = self.db_client.causal_token
+        created_ids = set()
+        for pending in batch:
+            # Only callers owning a failed record see the error, everyone else gets their result
+            if any(record["_id"] in failed_ids for record in pending.records):
+                METRICS.increment("write_coalescer_failed_requests_total")
+                pending.future.set_exception(error)
+                continue
+
+            res = {"updated": [], "created": []}
+            for record in pending.records:
+                # Only the first submission of a new document counts as its creation
+                if record["_id"] in upserted_ids and record["_id"] not in created_ids:
+                    created_ids.add(record["_id"])
+                    res["created"].append(record)
+                else:
+                    res["updated"].append(record)
+
+            pending.future.set_result((res, causal_token))
+
+
+_write_coalescers: Dict[Tuple[str, str], WriteCoalescer] = {}
+_write_coalescers_lock = Lock()
+
+
+def get_write_coalescer(database: str, collection: str, db_client: MongoDBClient) -> WriteCoalescer:
+    """
+    Process-wide write coalescer for a collection, created with db_client on first use
+    :param database:
+    :param collection:
+    :param db_client:
+    :return:
+    """
+    with _write_coalescers_lock:
+        if (database, collection) not in _write_coalescers:
+            _write_coalescers[(database, collection)] = WriteCoalescer(
+                db_client, window_seconds=WRITE_COALESCE_WINDOW_MS / 1000
+            )
+
+        return _write_coalescers[(database, collection)]
+
+
+@atexit.register
+def close_write_coalescers():
+    with _write_coalescers_lock:
+        write_coalescers = list(_write_coalescers.values())
+        _write_coalescers.clear()
+
+    for write_coalescer in write_coalescers:
+        write_coalescer.close()
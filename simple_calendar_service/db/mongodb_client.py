@@ -1,50 +1,286 @@
+import base64
 import os
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple, TYPE_CHECKING
 
-import pymongo
-from pymongo import ReplaceOne
-from pymongo.results import BulkWriteResult
-from pymongo.synchronous.collection import Collection
-from pymongo.synchronous.database import Database
+if TYPE_CHECKING:
+    # pymongo is imported on first use rather than at module load to keep app start-up fast
+    import pymongo
+    from pymongo.client_session import ClientSession
+    from pymongo.errors import BulkWriteError
+    from pymongo.read_preferences import _ServerMode
+    from pymongo.results import BulkWriteResult
+    from pymongo.synchronous.collection import Collection
+    from pymongo.synchronous.database import Database
+
+READ_PREFERENCE_MODES = ("primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest")
+# Smallest maximum staleness MongoDB accepts
+MIN_MAX_STALENESS_SECONDS = 90
+
+
+def validate_read_preference(mode: str, max_staleness_seconds: int):
+    """
+    Check read routing settings without importing pymongo, so misconfiguration fails at start-up rather than on
+    every request
+    :param mode:
+    :param max_staleness_seconds:
+    :raises ValueError: if either setting is invalid
+    """
+    if mode not in READ_PREFERENCE_MODES:
+        raise ValueError(f"Invalid read preference {mode!r}, expected one of {', '.join(READ_PREFERENCE_MODES)}")
+
+    if max_staleness_seconds != -1 and max_staleness_seconds < MIN_MAX_STALENESS_SECONDS:
+        raise ValueError(
+            f"Invalid max staleness of {max_staleness_seconds} seconds, expected -1 for no maximum or at least "
+            f"{MIN_MAX_STALENESS_SECONDS}"
+        )
+
+
+# Read routing - writes always go to the primary, reads follow MONGODB_READ_PREFERENCE
+MONGODB_READ_PREFERENCE = os.getenv("MONGODB_READ_PREFERENCE", "primary")
+# Maximum replication lag, in seconds, of a secondary used for reads. -1 means no maximum, otherwise must be >= 90
+MONGODB_MAX_STALENESS_SECONDS = int(os.getenv("MONGODB_MAX_STALENESS_SECONDS", -1))
+validate_read_preference(MONGODB_READ_PREFERENCE, MONGODB_MAX_STALENESS_SECONDS)
+
+# Collections this process has already created text indexes for
+_TEXT_INDEXED_COLLECTIONS = set()
+# Collections this process has already created sort indexes for
+_SORT_INDEXED_COLLECTIONS = set()
+
+
+def build_read_preference(mode: str, max_staleness_seconds: int = -1) -> "_ServerMode":
+    """
+    Build a pymongo read preference from its mode name, e.g. secondaryPreferred
+    :param mode: one of primary, primaryPreferred, secondary, secondaryPreferred or nearest
+    :param max_staleness_seconds: ignored for primary reads
+    :return:
+    """
+    from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+
+    validate_read_preference(mode, max_staleness_seconds)
+    mode = read_pref_mode_from_name(mode)
+
+    if mode == 0:
+        # Primary reads can't be stale, and pymongo rejects a max_staleness for them
+        max_staleness_seconds = -1
+
+    return make_read_preference(mode, None, max_staleness_seconds)
+
+
+class InvalidCausalTokenError(Exception):
+    pass
+
+
+class PartialWriteError(Exception):
+    """
+    Raised when a bulk upsert fails for some of its records, identifying which records were written
+    """
+
+    def __init__(self, message: str, failed_ids: List[Any], upserted_ids: List[Any]):
+        super().__init__(message)
+        self.failed_ids = failed_ids
+        self.upserted_ids = upserted_ids
+
+    @staticmethod
+    def from_bulk_write_error(
+        e: "BulkWriteError", records: List[Dict[str, Any]], ordered: bool
+    ) -> "PartialWriteError":
+        """
+        :param e:
+        :param records: records of the bulk write, in the order they were sent
+        :param ordered: whether the write stopped at its first error, leaving later records unwritten
+        :return:
+        """
+        write_errors = e.details.get("writeErrors", [])
+
+        if e.details.get("writeConcernErrors"):
+            # Whether any record was durably written is unknown
+            failed_indexes = range(len(records))
+        elif ordered and write_errors:
+            failed_indexes = range(min(error["index"] for error in write_errors), len(records))
+        else:
+            failed_indexes = [error["index"] for error in write_errors]
+
+        return PartialWriteError(
+            str(e),
+            failed_ids=[records[index]["_id"] for index in failed_indexes],
+            upserted_ids=[upserted["_id"] for upserted in e.details.get("upserted", [])],
+        )
+
+    @staticmethod
+    def combine(errors: List["PartialWriteError"], upserted_ids: List[Any]) -> "PartialWriteError":
+        """
+        Merge the errors of several bulk writes making up one upsert, e.g. one per partition or shard
+        :param errors:
+        :param upserted_ids: _ids upserted by the writes which succeeded
+        :return:
+        """
+        return PartialWriteError(
+            "; ".join(str(error) for error in errors),
+            failed_ids=[failed_id for error in errors for failed_id in error.failed_ids],
+            upserted_ids=upserted_ids + [upserted_id for error in errors for upserted_id in error.upserted_ids],
+        )
+
+
+def encode_causal_token(session: "ClientSession") -> str:
+    """
+    Serialise a causally consistent session's operation and cluster times, so a later request can read its writes
+    :param session:
+    :return: url-safe token
+    """
+    from bson import json_util
+
+    token = json_util.dumps(
+        {"operationTime": session.operation_time, "clusterTime": session.cluster_time}
+    )
+
+    return base64.urlsafe_b64encode(token.encode()).decode()
+
+
+def decode_causal_token(token: str) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Inverse of encode_causal_token. Tokens come from clients, so anything malformed raises InvalidCausalTokenError
+    :param token:
+    :return: operation time and cluster time
+    """
+    from bson import Timestamp, json_util
+
+    try:
+        decoded = json_util.loads(base64.urlsafe_b64decode(token.encode()))
+        operation_time, cluster_time = decoded["operationTime"], decoded["clusterTime"]
+    except (ValueError, TypeError, KeyError, UnicodeError) as e:
+        raise InvalidCausalTokenError(f"Invalid causal token: {str(e)}") from e
+
+    if not isinstance(operation_time, Timestamp) or not isinstance(cluster_time, dict):
+        raise InvalidCausalTokenError("Invalid causal token: expected operationTime and clusterTime")
+
+    return operation_time, cluster_time
 
 
 class MongoDBClient:
     def __init__(
-        self, database: str, collection: str, client: pymongo.MongoClient = None
+        self,
+        database: str,
+        collection: str,
+        client: "pymongo.MongoClient" = None,
+        read_preference: Optional[str] = None,
+        max_staleness_seconds: Optional[int] = None,
+        causal_token: Optional[str] = None,
+        shard_name: Optional[str] = None,
     ):
+        """
+        :param database:
+        :param collection:
+        :param client: existing client to use instead of connecting with the MONGODB_* environment variables
+        :param read_preference: read preference mode name, defaults to MONGODB_READ_PREFERENCE
+        :param max_staleness_seconds: defaults to MONGODB_MAX_STALENESS_SECONDS
+        :param causal_token: token returned by an earlier write, reads will observe that write even from a secondary
+        :param shard_name: name of the shard this client serves when events are sharded, see ShardedMongoDBClient
+        """
+        import pymongo
+
+        if not client:
+            client_options = {}
+            if os.getenv("MONGODB_REPLICA_SET"):
+                client_options["replicaSet"] = os.getenv("MONGODB_REPLICA_SET")
+
+            client = pymongo.MongoClient(
+                host=os.getenv("MONGODB_HOSTNAME"),
+                port=int(os.getenv("MONGODB_PORT", 0)),
+                username=os.getenv("MONGODB_ROOT_USERNAME"),
+                password=os.getenv("MONGODB_ROOT_PASSWORD"),
+                authSource=os.getenv("MONGODB_AUTHSOURCE"),
+                **client_options,
+            )
 
-        self.client = pymongo.MongoClient(
-            host=os.getenv("MONGODB_HOSTNAME"),
-            port=int(os.getenv("MONGODB_PORT", 0)),
-            username=os.getenv("MONGODB_ROOT_USERNAME"),
-            password=os.getenv("MONGODB_ROOT_PASSWORD"),
-            authSource=os.getenv("MONGODB_AUTHSOURCE"),
+        self.client = client
+        self.db: "Database" = self.client[database]
+        self.collection: "Collection" = self.db[collection]
+
+        self.read_preference = build_read_preference(
+            read_preference or MONGODB_READ_PREFERENCE,
+            MONGODB_MAX_STALENESS_SECONDS if max_staleness_seconds is None else max_staleness_seconds,
+        )
+        self.read_collection: "Collection" = self.collection.with_options(
+            read_preference=self.read_preference
         )
+        self.causal_token = causal_token
+        # Distinguishes identically named collections of different shards in per-process index caches
+        self.shard_name = shard_name
 
-        self.db: Database = self.client[database]
-        self.collection: Collection = self.db[collection]
+    @property
+    def reads_from_primary(self) -> bool:
+        return self.read_preference.mode == 0
 
-    def execute_write_transaction(self, queries):
-        return self.collection.bulk_write(queries)
+    def start_causal_session(self) -> "ClientSession":
+        """
+        Start a causally consistent session, advanced to the point in time of causal_token if set
+        :return:
+        """
+        session = self.client.start_session(causal_consistency=True)
+
+        if self.causal_token:
+            operation_time, cluster_time = decode_causal_token(self.causal_token)
+            session.advance_cluster_time(cluster_time)
+            session.advance_operation_time(operation_time)
+
+        return session
+
+    def _read_target(
+        self, collection: Optional["Collection"] = None
+    ) -> Tuple["Collection", Optional["ClientSession"]]:
+        """
+        Collection and session for a read - reads following a write use a causal session with majority read concern,
+        so a secondary waits until it has replicated that write
+        :param collection: collection to read from, defaults to this client's collection
+        :return:
+        """
+        if collection is None:
+            read_collection = self.read_collection
+        else:
+            read_collection = collection.with_options(read_preference=self.read_preference)
+
+        if not self.causal_token or self.reads_from_primary:
+            return read_collection, None
+
+        from pymongo.read_concern import ReadConcern
+
+        return (
+            read_collection.with_options(read_concern=ReadConcern("majority")),
+            self.start_causal_session(),
+        )
+
+    @staticmethod
+    def _iterate_in_session(cursor, session: "ClientSession"):
+        try:
+            yield from cursor
+        finally:
+            session.end_session()
+
+    def execute_write_transaction(
+        self, queries, collection: Optional["Collection"] = None, ordered: bool = True
+    ):
+        if collection is None:
+            collection = self.collection
+
+        if self.reads_from_primary:
+            return collection.bulk_write(queries, ordered=ordered)
+
+        # Reads may be served by secondaries, so record the write's position for read-your-writes
+        with self.start_causal_session() as session:
+            res = collection.bulk_write(queries, ordered=ordered, session=session)
+            self.causal_token = encode_causal_token(session)
+
+        return res
 
     def insert_document(self, document: Dict[str, Any]):
         return self.collection.insert_one(document=document)
 
     def insert_documents(self, documents: List[Any]) -> Dict[str, Any]:
-        batch_upsert_query = []
-        document_with_ids = []
-        for document in documents:
-            document_with_id = document.convert_to_mongodb_record()
-            document_with_ids.append(document_with_id)
-            upsert_document_query = ReplaceOne(
-                {"_id": document_with_id["_id"]}, document_with_id, upsert=True
-            )
-            batch_upsert_query.append(upsert_document_query)
+        document_with_ids = [document.convert_to_mongodb_record() for document in documents]
 
-        res: BulkWriteResult = self.execute_write_transaction(batch_upsert_query)
+        upserted_ids = self.upsert_records(document_with_ids)
 
-        upserted_ids = list(res.upserted_ids.values())
         upserted = [
             event for event in document_with_ids if event["_id"] not in upserted_ids
         ]
@@ -52,27 +288,248 @@ class MongoDBClient:
 
         return {"updated": upserted, "created": created}
 
+    def upsert_records(self, records: List[Dict[str, Any]], ordered: bool = True) -> List[Any]:
+        """
+        Replace or insert records by _id
+        :param records:
+        :param ordered: whether MongoDB applies the writes in order, stopping at the first error
+        :return: _ids of the records which were inserted rather than replaced
+        :raises PartialWriteError: if some records couldn't be written
+        """
+        return self.upsert_records_into(self.collection, records, ordered=ordered)
+
+    def upsert_records_into(
+        self, collection: "Collection", records: List[Dict[str, Any]], ordered: bool = True
+    ) -> List[Any]:
+        from pymongo import ReplaceOne
+        from pymongo.errors import BulkWriteError
+
+        batch_upsert_query = [
+            ReplaceOne({"_id": record["_id"]}, record, upsert=True) for record in records
+        ]
+
+        try:
+            res: "BulkWriteResult" = self.execute_write_transaction(
+                batch_upsert_query, collection, ordered=ordered
+            )
+        except BulkWriteError as e:
+            raise PartialWriteError.from_bulk_write_error(e, records, ordered) from e
+
+        return list(res.upserted_ids.values())
+
     def get_document(self, query: Dict[str, Any]):
         """
         Get document from collection
         :param query: key value pair representing the field and value to query for
         :return:
         """
-        return self.collection.find_one(filter=query)
+        collection, session = self._read_target()
+
+        try:
+            return collection.find_one(filter=query, session=session)
+        finally:
+            if session:
+                session.end_session()
 
     def get_documents_by_date_range(
         self,
         datetime_field: str,
         datetime_lower: Optional[datetime] = None,
         datetime_upper: Optional[datetime] = None,
+        batch_size: Optional[int] = None,
+        max_time_ms: Optional[int] = None,
+        sort: bool = False,
     ):
         """
         Query documents by date range - one of either datetime_lower or datetime_upper must be provided
         :param datetime_field:
         :param datetime_lower:
         :param datetime_upper:
+        :param batch_size: number of documents the cursor fetches from MongoDB per round-trip
+        :param max_time_ms: server-side time limit for the query, exceeding it raises pymongo.errors.ExecutionTimeout
+        :param sort: return documents sorted by datetime_field
         :return:
         """
+        datetime_range_filter = MongoDBClient.get_date_range_filter(
+            datetime_lower, datetime_upper
+        )
+
+        collection, session = self._read_target()
+        cursor = collection.find({datetime_field: datetime_range_filter}, session=session)
+
+        if sort:
+            from pymongo import ASCENDING
+
+            cursor = cursor.sort(datetime_field, ASCENDING)
+
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+
+        if max_time_ms:
+            cursor = cursor.max_time_ms(max_time_ms)
+
+        if session:
+            # The cursor doesn't end sessions it didn't start, so end it once the results are consumed
+            return MongoDBClient._iterate_in_session(cursor, session)
+
+        return cursor
+
+    def count_documents_by_date_range(
+        self,
+        datetime_field: str,
+        datetime_lower: Optional[datetime] = None,
+        datetime_upper: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        max_time_ms: Optional[int] = None,
+    ) -> int:
+        """
+        Count documents by date range - one of either datetime_lower or datetime_upper must be provided
+        :param datetime_field:
+        :param datetime_lower:
+        :param datetime_upper:
+        :param limit: stop counting after this many documents, bounding the cost of the count
+        :param max_time_ms: server-side time limit for the count, exceeding it raises pymongo.errors.ExecutionTimeout
+        :return:
+        """
+        datetime_range_filter = MongoDBClient.get_date_range_filter(
+            datetime_lower, datetime_upper
+        )
+
+        return self.count_documents_in(
+            self.collection,
+            {datetime_field: datetime_range_filter},
+            limit=limit,
+            max_time_ms=max_time_ms,
+        )
+
+    def count_documents_in(
+        self,
+        collection: "Collection",
+        query: Dict[str, Any],
+        limit: Optional[int] = None,
+        max_time_ms: Optional[int] = None,
+    ) -> int:
+        options = {}
+        if limit:
+            options["limit"] = limit
+        if max_time_ms:
+            options["maxTimeMS"] = max_time_ms
+
+        collection, session = self._read_target(collection)
+
+        try:
+            return collection.count_documents(query, session=session, **options)
+        finally:
+            if session:
+                session.end_session()
+
+    def get_all_documents(self, batch_size: Optional[int] = None):
+        collection, session = self._read_target()
+        cursor = collection.find({}, session=session)
+
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+
+        if session:
+            return MongoDBClient._iterate_in_session(cursor, session)
+
+        return cursor
+
+    def create_sort_index(self, field: str):
+        """
+        Create an ascending index on field, which date range queries filter and sort on, if this process hasn't already
+        :param field:
+        """
+        from pymongo import ASCENDING
+
+        key = (self.shard_name, self.db.name, self.collection.name, field)
+        if key not in _SORT_INDEXED_COLLECTIONS:
+            self.collection.create_index([(field, ASCENDING)])
+            _SORT_INDEXED_COLLECTIONS.add(key)
+
+    def create_text_index(self, field: str, collection: Optional["Collection"] = None):
+        """
+        Create a text index on field if this process hasn't already, a collection can only have one text index
+        :param field:
+        :param collection: defaults to this client's collection
+        """
+        from pymongo import TEXT
+
+        if collection is None:
+            collection = self.collection
+
+        key = (self.shard_name, self.db.name, collection.name, field)
+        if key not in _TEXT_INDEXED_COLLECTIONS:
+            collection.create_index([(field, TEXT)])
+            _TEXT_INDEXED_COLLECTIONS.add(key)
+
+    def search_documents(
+        self,
+        query: str,
+        datetime_field: str,
+        datetime_lower: Optional[datetime] = None,
+        datetime_upper: Optional[datetime] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        max_time_ms: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Full-text search using the collection's text index, optionally within a date range
+        :param query: MongoDB $text search string
+        :param datetime_field:
+        :param datetime_lower:
+        :param datetime_upper:
+        :param skip: number of ranked results to skip, for pagination
+        :param limit: maximum number of results to return
+        :param max_time_ms: server-side time limit for the query, exceeding it raises pymongo.errors.ExecutionTimeout
+        :return: matching documents, with their relevance as "score", ordered by descending score then time
+        """
+        return list(
+            self.search_documents_in(
+                self.collection, query, datetime_field, datetime_lower, datetime_upper, skip, limit, max_time_ms
+            )
+        )
+
+    def search_documents_in(
+        self,
+        collection: "Collection",
+        query: str,
+        datetime_field: str,
+        datetime_lower: Optional[datetime] = None,
+        datetime_upper: Optional[datetime] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        max_time_ms: Optional[int] = None,
+    ):
+        from pymongo import ASCENDING
+
+        search_filter: Dict[str, Any] = {"$text": {"$search": query}}
+        if datetime_lower or datetime_upper:
+            search_filter[datetime_field] = MongoDBClient.get_date_range_filter(
+                datetime_lower, datetime_upper
+            )
+
+        collection, session = self._read_target(collection)
+        cursor = collection.find(
+            search_filter, {"score": {"$meta": "textScore"}}, session=session
+        ).sort([("score", {"$meta": "textScore"}), (datetime_field, ASCENDING)])
+
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        if max_time_ms:
+            cursor = cursor.max_time_ms(max_time_ms)
+
+        if session:
+            return MongoDBClient._iterate_in_session(cursor, session)
+
+        return cursor
+
+    @staticmethod
+    def get_date_range_filter(
+        datetime_lower: Optional[datetime], datetime_upper: Optional[datetime]
+    ) -> Dict[str, datetime]:
         if not datetime_lower and not datetime_upper:
             raise ValueError(
                 "One of datetime_lower or datetime_upper must not be None!"
@@ -90,4 +547,4 @@ class MongoDBClient:
                 raise TypeError("datetime_upper must be a datetime object!")
             datetime_range_filter["$lt"] = datetime_upper
 
-        return self.collection.find({datetime_field: datetime_range_filter})
+        return datetime_range_filter
@@ -0,0 +1,442 @@
+import heapq
+import os
+import re
+import time
+from collections import defaultdict
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Any, List, Optional, Tuple, TYPE_CHECKING
+
+from simple_calendar_service.db.mongodb_client import (
+    MongoDBClient,
+    PartialWriteError,
+    _TEXT_INDEXED_COLLECTIONS,
+)
+
+if TYPE_CHECKING:
+    from pymongo.synchronous.collection import Collection
+
+# "monthly" routes events to a collection per month of their time, "none" keeps every event in a single collection
+MONGODB_PARTITIONING = os.getenv("MONGODB_PARTITIONING", "none")
+
+# Partitions this process has already created indexes for
+_INDEXED_PARTITIONS = set()
+
+
+class PartitionedMongoDBClient(MongoDBClient):
+    """
+    MongoDBClient which stores documents in per-month collections, named <collection>_<YYYY>_<MM>, by the value of
+    their partition field. Date range queries only read the partitions overlapping the range, and return documents
+    sorted by time. A <collection>_partition_index collection maps each _id to its partition, so documents can still
+    be fetched by _id with a single lookup and moved when their time changes month.
+    """
+
+    def __init__(self, database: str, collection: str, partition_field: str = "time", **kwargs):
+        super().__init__(database=database, collection=collection, **kwargs)
+
+        self.collection_name = collection
+        self.partition_field = partition_field
+        self.partition_index: "Collection" = self.db[f"{collection}_partition_index"]
+        self.partition_pattern = re.compile(rf"^{re.escape(collection)}_(\d{{4}})_(\d{{2}})$")
+
+    def partition_name(self, time: datetime) -> str:
+        return f"{self.collection_name}_{time.year:04d}_{time.month:02d}"
+
+    def partition_bounds(self, partition: str) -> Tuple[datetime, datetime]:
+        """
+        :param partition:
+        :return: start (inclusive) and end (exclusive) of the month stored in partition
+        """
+        year, month = (int(group) for group in self.partition_pattern.match(partition).groups())
+        start = datetime(year, month, 1)
+        end = datetime(year + month // 12, month % 12 + 1, 1)
+
+        return start, end
+
+    def list_partitions(self) -> List[str]:
+        """
+        :return: existing partitions in chronological order
+        """
+        # Zero padded names sort chronologically
+        return sorted(
+            name for name in self.db.list_collection_names() if self.partition_pattern.match(name)
+        )
+
+    def partitions_for_range(
+        self, datetime_lower: Optional[datetime], datetime_upper: Optional[datetime]
+    ) -> List[str]:
+        """
+        Prune partitions to those overlapping [datetime_lower, datetime_upper)
+        :param datetime_lower:
+        :param datetime_upper:
+        :return: partitions in chronological order
+        """
+        partitions = []
+        for partition in self.list_partitions():
+            start, end = self.partition_bounds(partition)
+            if (datetime_upper is None or start < datetime_upper) and (
+                datetime_lower is None or end > datetime_lower
+            ):
+                partitions.append(partition)
+
+        return partitions
+
+    def ensure_partition(self, partition: str):
+        from pymongo import ASCENDING
+
+        key = (self.shard_name, self.db.name, partition)
+        if key not in _INDEXED_PARTITIONS:
+            self.db[partition].create_index([(self.partition_field, ASCENDING)])
+            _INDEXED_PARTITIONS.add(key)
+
+    def upsert_records(self, records: List[Dict[str, Any]], ordered: bool = True) -> List[Any]:
+        from pymongo import UpdateOne
+
+        # A record repeated with times in different months would be written to both partitions, so only its last
+        # version is kept, as a single collection would end up with
+        records = list({record["_id"]: record for record in records}.values())
+
+        records_by_partition = defaultdict(list)
+        for record in records:
+            records_by_partition[self.partition_name(record[self.partition_field])].append(record)
+
+        ids = [record["_id"] for record in records]
+        previous_partitions = {
+            entry["_id"]: entry["partition"]
+            for entry in self.partition_index.find({"_id": {"$in": ids}})
+        }
+
+        upserted_ids = []
+        errors: List[PartialWriteError] = []
+        written_records_by_partition = {}
+        for partition, partition_records in records_by_partition.items():
+            if errors and ordered:
+                # An ordered write stops at its first error, later partitions aren't written
+                errors.append(
+                    PartialWriteError(
+                        "not attempted", failed_ids=[record["_id"] for record in partition_records], upserted_ids=[]
+                    )
+                )
+                continue
+
+            self.ensure_partition(partition)
+            try:
+                upserted_ids += self.upsert_records_into(
+                    self.db[partition], partition_records, ordered=ordered
+                )
+                failed_ids = set()
+            except PartialWriteError as e:
+                errors.append(e)
+                failed_ids = set(e.failed_ids)
+
+            written_records_by_partition[partition] = [
+                record for record in partition_records if record["_id"] not in failed_ids
+            ]
+
+        moved_ids = defaultdict(list)
+        for partition, partition_records in written_records_by_partition.items():
+            for record in partition_records:
+                previous_partition = previous_partitions.get(record["_id"])
+                if previous_partition and previous_partition != partition:
+                    moved_ids[previous_partition].append(record["_id"])
+
+        index_updates = [
+            UpdateOne({"_id": record["_id"]}, {"$set": {"partition": partition}}, upsert=True)
+            for partition, partition_records in written_records_by_partition.items()
+            for record in partition_records
+        ]
+        if index_updates:
+            self.execute_write_transaction(index_updates, self.partition_index, ordered=ordered)
+
+        # Remove the old copies of documents whose time moved to another month, only once the index points at the new
+        # copies, so a failure in between leaves a stale copy behind rather than an index entry with no document
+        for partition, partition_ids in moved_ids.items():
+            self.db[partition].delete_many({"_id": {"$in": partition_ids}})
+
+        if errors:
+            error = PartialWriteError.combine(errors, upserted_ids)
+            error.upserted_ids = [
+                upserted_id for upserted_id in error.upserted_ids if upserted_id not in previous_partitions
+            ]
+            raise error
+
+        # Moving a document between partitions is an update rather than a creation
+        return [upserted_id for upserted_id in upserted_ids if upserted_id not in previous_partitions]
+
+    def get_document(self, query: Dict[str, Any]):
+        """
+        Get document from its partition - queries by _id need a single partition index lookup, any other query
+        searches partitions from newest to oldest
+        :param query: key value pair representing the field and value to query for
+        :return:
+        """
+        if "_id" in query:
+            index_collection, session = self._read_target(self.partition_index)
+            try:
+                entry = index_collection.find_one(filter={"_id": query["_id"]}, session=session)
+            finally:
+                if session:
+                    session.end_session()
+
+            partitions = [entry["partition"]] if entry else []
+        else:
+            partitions = reversed(self.list_partitions())
+
+        for partition in partitions:
+            collection, session = self._read_target(self.db[partition])
+            try:
+                document = collection.find_one(filter=query, session=session)
+            finally:
+                if session:
+                    session.end_session()
+
+            if document:
+                return document
+
+        return None
+
+    def get_documents_by_date_range(
+        self,
+        datetime_field: str,
+        datetime_lower: Optional[datetime] = None,
+        datetime_upper: Optional[datetime] = None,
+        batch_size: Optional[int] = None,
+        max_time_ms: Optional[int] = None,
+        sort: bool = False,
+    ):
+        """
+        Query documents by date range from the partitions overlapping it. Partitions are read lazily in chronological
+        order, each sorted by datetime_field, so querying the partition field returns results in order without holding
+        more than one cursor open
+        :param datetime_field:
+        :param datetime_lower:
+        :param datetime_upper:
+        :param batch_size: number of documents the cursor fetches from MongoDB per round-trip
+        :param max_time_ms: time limit for the query across all partitions, exceeding it raises
+        pymongo.errors.ExecutionTimeout
+        :param sort: also return documents in order when datetime_field isn't the partition field, by merging every
+        partition's cursor
+        :return:
+        """
+        datetime_range_filter = MongoDBClient.get_date_range_filter(
+            datetime_lower, datetime_upper
+        )
+        partitions = self._partitions_for_query(datetime_field, datetime_lower, datetime_upper)
+
+        if sort and datetime_field != self.partition_field:
+            return heapq.merge(
+                *(
+                    self._iterate_partitions(
+                        [partition], {datetime_field: datetime_range_filter}, datetime_field, batch_size, max_time_ms
+                    )
+                    for partition in partitions
+                ),
+                key=lambda document: document[datetime_field],
+            )
+
+        return self._iterate_partitions(
+            partitions,
+            {datetime_field: datetime_range_filter},
+            datetime_field,
+            batch_size,
+            max_time_ms,
+        )
+
+    def count_documents_by_date_range(
+        self,
+        datetime_field: str,
+        datetime_lower: Optional[datetime] = None,
+        datetime_upper: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        max_time_ms: Optional[int] = None,
+    ) -> int:
+        datetime_range_filter = MongoDBClient.get_date_range_filter(
+            datetime_lower, datetime_upper
+        )
+        deadline = PartitionedMongoDBClient._deadline(max_time_ms)
+
+        count = 0
+        for partition in self._partitions_for_query(datetime_field, datetime_lower, datetime_upper):
+            if limit and count >= limit:
+                break
+
+            count += self.count_documents_in(
+                self.db[partition],
+                {datetime_field: datetime_range_filter},
+                limit=limit - count if limit else None,
+                max_time_ms=PartitionedMongoDBClient._remaining_ms(deadline),
+            )
+
+        return count
+
+    def get_all_documents(self, batch_size: Optional[int] = None):
+        return self._iterate_partitions(self.list_partitions(), {}, self.partition_field, batch_size)
+
+    def create_sort_index(self, field: str):
+        """
+        Nothing to do - partitions are indexed on the partition field, which range queries sort on, by ensure_partition
+        as they are created. The unpartitioned collection is left alone, so it isn't recreated once migrated away
+        :param field:
+        """
+
+    def create_text_index(self, field: str, collection: Optional["Collection"] = None):
+        """
+        Create a text index on field in every partition, or in collection if given
+        :param field:
+        :param collection:
+        """
+        if collection is not None:
+            return super().create_text_index(field, collection)
+
+        for partition in self.list_partitions():
+            super().create_text_index(field, self.db[partition])
+
+    def search_documents(
+        self,
+        query: str,
+        datetime_field: str,
+        datetime_lower: Optional[datetime] = None,
+        datetime_upper: Optional[datetime] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+        max_time_ms: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Full-text search across the partitions overlapping the date range. Each partition returns its top skip + limit
+        results, which are merged by score
+        :return: matching documents, with their relevance as "score", ordered by descending score then time
+        """
+        deadline = PartitionedMongoDBClient._deadline(max_time_ms)
+
+        partition_results = []
+        for partition in self._partitions_for_query(datetime_field, datetime_lower, datetime_upper):
+            partition_results.append(
+                list(
+                    self.search_documents_in(
+                        self.db[partition],
+                        query,
+                        datetime_field,
+                        datetime_lower,
+                        datetime_upper,
+                        limit=skip + limit if limit else None,
+                        max_time_ms=PartitionedMongoDBClient._remaining_ms(deadline),
+                    )
+                )
+            )
+
+        merged = heapq.merge(
+            *partition_results, key=lambda document: (-document["score"], document[datetime_field])
+        )
+
+        return list(islice(merged, skip, skip + limit if limit else None))
+
+    def _partitions_for_query(
+        self, datetime_field: str, datetime_lower: Optional[datetime], datetime_upper: Optional[datetime]
+    ) -> List[str]:
+        if datetime_field == self.partition_field:
+            return self.partitions_for_range(datetime_lower, datetime_upper)
+
+        return self.list_partitions()
+
+    @staticmethod
+    def _deadline(max_time_ms: Optional[int]) -> Optional[float]:
+        return time.monotonic() + max_time_ms / 1000 if max_time_ms else None
+
+    @staticmethod
+    def _remaining_ms(deadline: Optional[float]) -> Optional[int]:
+        """
+        Time left for a query spanning several partitions
+        :param deadline:
+        :return: milliseconds, or None if the query has no time limit
+        """
+        if deadline is None:
+            return None
+
+        remaining_ms = int((deadline - time.monotonic()) * 1000)
+        if remaining_ms <= 0:
+            from pymongo.errors import ExecutionTimeout
+
+            raise ExecutionTimeout("operation exceeded time limit")
+
+        return remaining_ms
+
+    def _iterate_partitions(
+        self,
+        partitions: List[str],
+        query: Dict[str, Any],
+        sort_field: str,
+        batch_size: Optional[int],
+        max_time_ms: Optional[int] = None,
+    ):
+        from pymongo import ASCENDING
+
+        deadline = PartitionedMongoDBClient._deadline(max_time_ms)
+
+        for partition in partitions:
+            remaining_ms = PartitionedMongoDBClient._remaining_ms(deadline)
+
+            collection, session = self._read_target(self.db[partition])
+            cursor = collection.find(query, session=session).sort(sort_field, ASCENDING)
+
+            if batch_size:
+                cursor = cursor.batch_size(batch_size)
+
+            if remaining_ms:
+                cursor = cursor.max_time_ms(remaining_ms)
+
+            if session:
+                yield from MongoDBClient._iterate_in_session(cursor, session)
+            else:
+                yield from cursor
+
+    def drop_partitions_before(self, cutoff: datetime) -> List[str]:
+        """
+        Retention - drop every partition which only holds documents older than cutoff
+        :param cutoff:
+        :return: dropped partitions
+        """
+        dropped = [
+            partition
+            for partition in self.list_partitions()
+            if self.partition_bounds(partition)[1] <= cutoff
+        ]
+
+        for partition in dropped:
+            self.db.drop_collection(partition)
+            _INDEXED_PARTITIONS.discard((self.shard_name, self.db.name, partition))
+            _TEXT_INDEXED_COLLECTIONS.difference_update(
+                [
+                    key
+                    for key in _TEXT_INDEXED_COLLECTIONS
+                    if key[:3] == (self.shard_name, self.db.name, partition)
+                ]
+            )
+
+        if dropped:
+            self.partition_index.delete_many({"partition": {"$in": dropped}})
+
+        return dropped
+
+    def migrate_from_collection(self, batch_size: int = 1000, drop_source: bool = False) -> int:
+        """
+        Copy documents from the unpartitioned collection into partitions, in batches. Safe to re-run as documents are
+        upserted by _id
+        :param batch_size:
+        :param drop_source: drop the unpartitioned collection once all documents are copied
+        :return: number of documents migrated
+        """
+        documents = iter(self.collection.find().batch_size(batch_size))
+        migrated = 0
+
+        while True:
+            batch = list(islice(documents, batch_size))
+            if not batch:
+                break
+
+            self.upsert_records(batch)
+            migrated += len(batch)
+
+        if drop_source:
+            self.collection.drop()
+
+        return migrated
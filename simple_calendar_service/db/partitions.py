@@ -0,0 +1,84 @@
+"""
+Maintenance tooling for time-partitioned event collections (MONGODB_PARTITIONING=monthly).
+
+Usage:
+
+    python -m simple_calendar_service.db.partitions list
+    python -m simple_calendar_service.db.partitions drop-before 2023-01-01T00:00:00
+    python -m simple_calendar_service.db.partitions migrate [--batch-size 1000] [--drop-source]
+
+Connection settings are read from the same MONGODB_* environment variables as the app. When MONGODB_SHARDS is set each
+command runs against every shard in turn, and output lines are prefixed with the shard name.
+"""
+import argparse
+import os
+from datetime import datetime
+from typing import Dict
+
+from simple_calendar_service.db.partitioned_mongodb_client import PartitionedMongoDBClient
+from simple_calendar_service.db.sharded_mongodb_client import (
+    MONGODB_SHARDS,
+    ShardedMongoDBClient,
+    get_shard_clients,
+    parse_shards,
+)
+
+
+def get_partitioned_clients() -> Dict[str, PartitionedMongoDBClient]:
+    """
+    :return: client by shard name, or a single client named "" when sharding is disabled
+    """
+    database = os.getenv("MONGODB_DATABASE")
+    collection = os.getenv("MONGODB_EVENTS_COLLECTION_NAME")
+
+    if MONGODB_SHARDS:
+        return ShardedMongoDBClient(
+            database=database,
+            collection=collection,
+            shards=get_shard_clients(parse_shards(MONGODB_SHARDS)),
+            shard_client_class=PartitionedMongoDBClient,
+        ).shards
+
+    return {"": PartitionedMongoDBClient(database=database, collection=collection)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain time-partitioned event collections")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("list", help="list partitions in chronological order")
+
+    drop_before = subparsers.add_parser(
+        "drop-before", help="drop partitions which only hold events older than a cutoff"
+    )
+    drop_before.add_argument("cutoff", help="cutoff time, in the format %%Y-%%m-%%dT%%H:%%M:%%S")
+
+    migrate = subparsers.add_parser(
+        "migrate", help="copy events from the unpartitioned collection into partitions"
+    )
+    migrate.add_argument("--batch-size", type=int, default=1000)
+    migrate.add_argument(
+        "--drop-source", action="store_true", help="drop the unpartitioned collection once migrated"
+    )
+
+    args = parser.parse_args(argv)
+
+    for shard_name, client in get_partitioned_clients().items():
+        prefix = f"{shard_name}: " if shard_name else ""
+
+        if args.command == "list":
+            for partition in client.list_partitions():
+                print(f"{prefix}{partition}")
+        elif args.command == "drop-before":
+            cutoff = datetime.strptime(args.cutoff, "%Y-%m-%dT%H:%M:%S")
+            for partition in client.drop_partitions_before(cutoff):
+                print(f"{prefix}Dropped {partition}")
+        elif args.command == "migrate":
+            migrated = client.migrate_from_collection(
+                batch_size=args.batch_size, drop_source=args.drop_source
+            )
+            print(f"{prefix}Migrated {migrated} events")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Dict, Any, Optional
+
+from flasgger import Swagger
+
+SWAGGER_CONFIG = {
+    "title": "Simple Calendar Service",
+    "uiversion": 3,
+    "openapi": "3.0.2",
+}
+
+
+class CachedSwagger(Swagger):
+    """
+    Swagger extension which persists generated OpenAPI specs to disk, so the YAML docstrings are only parsed once
+    per deployment rather than once per worker (or once per request when running in debug mode).
+    """
+
+    def __init__(self, *args, spec_cache_path: Optional[str] = None, **kwargs):
+        self.spec_cache_path = spec_cache_path
+        super().__init__(*args, **kwargs)
+
+    def get_apispecs(self, endpoint="apispec_1") -> Dict[str, Any]:
+        if endpoint in self.apispecs:
+            return self.apispecs[endpoint]
+
+        cached_spec = self._read_cached_spec(endpoint)
+        if cached_spec is not None:
+            self.apispecs[endpoint] = cached_spec
+            return cached_spec
+
+        spec = super().get_apispecs(endpoint)
+        self._write_cached_spec(endpoint, spec)
+
+        return spec
+
+    def _spec_digest(self) -> str:
+        """
+        Fingerprint of the routes and their docstrings, so a cached spec is never served for a different version of
+        the API
+        :return:
+        """
+        digest = hashlib.sha256(json.dumps(self.config, sort_keys=True, default=str).encode())
+        for rule in sorted(self.app.url_map.iter_rules(), key=lambda r: r.rule):
+            view = self.app.view_functions.get(rule.endpoint)
+            digest.update(f"{rule.rule}:{sorted(rule.methods)}:{getattr(view, '__doc__', '')}".encode())
+
+        return digest.hexdigest()[:16]
+
+    def _cache_file(self, endpoint: str) -> Optional[str]:
+        if not self.spec_cache_path:
+            return None
+
+        return os.path.join(self.spec_cache_path, f"{endpoint}-{self._spec_digest()}.json")
+
+    def _read_cached_spec(self, endpoint: str) -> Optional[Dict[str, Any]]:
+        cache_file = self._cache_file(endpoint)
+
+        if not cache_file or not os.path.exists(cache_file):
+            return None
+
+        try:
+            with open(cache_file) as spec_file:
+                return json.load(spec_file)
+        except json.JSONDecodeError:
+            # A corrupt cache file is treated as a miss, and replaced once the spec is regenerated
+            return None
+
+    def _write_cached_spec(self, endpoint: str, spec: Dict[str, Any]):
+        cache_file = self._cache_file(endpoint)
+
+        if not cache_file:
+            return
+
+        os.makedirs(self.spec_cache_path, exist_ok=True)
+
+        # Written to a temporary file then renamed over the cache file, so workers never read a partly written spec
+        file_descriptor, temporary_file = tempfile.mkstemp(dir=self.spec_cache_path, suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "w") as spec_file:
+                json.dump(spec, spec_file)
+            os.replace(temporary_file, cache_file)
+        except BaseException:
+            os.remove(temporary_file)
+            raise
+
+
+def init_swagger(app, spec_cache_path: Optional[str] = None) -> CachedSwagger:
+    app.config["SWAGGER"] = SWAGGER_CONFIG
+    return CachedSwagger(app, spec_cache_path=spec_cache_path)
@@ -0,0 +1,45 @@
+from collections import defaultdict
+from threading import Lock
+from typing import Dict
+
+
+class Metrics:
+    """
+    Minimal thread-safe in-process metrics registry. Metric names are keyed together with their labels, e.g.
+    compression_bytes_in{encoding="gzip"}
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._values: Dict[str, float] = defaultdict(float)
+
+    @staticmethod
+    def key(name: str, **labels) -> str:
+        if not labels:
+            return name
+
+        formatted_labels = ",".join(f'{label}="{value}"' for label, value in sorted(labels.items()))
+        return f"{name}{{{formatted_labels}}}"
+
+    def increment(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._values[Metrics.key(name, **labels)] += value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._values[Metrics.key(name, **labels)] = value
+
+    def get(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._values.get(Metrics.key(name, **labels), 0)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+METRICS = Metrics()
@@ -0,0 +1,378 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from collections.abc import Iterator
+from functools import wraps
+from types import FunctionType
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+# Interval between stack samples of profiled requests in sampler mode
+PROFILING_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILING_SAMPLE_INTERVAL_MS", 5))
+
+MODES = ("sampler", "cprofile")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _folded_stack(frame) -> str:
+    """
+    :param frame: innermost frame
+    :return: stack in folded format, root first, e.g. app.py:main;event.py:EventDAO.get_event_by_id
+    """
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+
+    return ";".join(reversed(labels))
+
+
+class _TimedIterator:
+    """
+    Wraps an iterator returned by a timed method, adding the time spent consuming it to the method's stage. The stage
+    is recorded once, when the iterator is exhausted, closed or garbage collected. Other attributes, e.g. of pymongo
+    cursors, are passed through
+    """
+
+    def __init__(self, profiler: "Profiler", name: str, iterator: Iterator, elapsed: float):
+        self._profiler = profiler
+        self._name = name
+        self._iterator = iterator
+        self._elapsed = elapsed
+        self._recorded = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            item = next(self._iterator)
+        except BaseException:
+            self._elapsed += time.perf_counter() - start
+            self._record()
+            raise
+
+        self._elapsed += time.perf_counter() - start
+        return item
+
+    def __getattr__(self, name: str):
+        # Only called for attributes the wrapper doesn't have, private ones are never passed through so a partly
+        # initialised wrapper can't recurse
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        return getattr(self._iterator, name)
+
+    def close(self):
+        try:
+            close = getattr(self._iterator, "close", None)
+            if close:
+                close()
+        finally:
+            self._record()
+
+    def __del__(self):
+        self._record()
+
+    def _record(self):
+        if not self._recorded:
+            self._recorded = True
+            self._profiler.record_stage(self._name, self._elapsed)
+
+
+class Profiler:
+    """
+    On-demand profiler for live requests. While armed, requests are profiled either with a stack sampler, producing
+    flamegraph-compatible folded stacks, or with cProfile. Profiled requests also record per-stage timings of the
+    classes registered with instrument(), whose methods are only wrapped while the profiler is armed so it costs
+    nothing when off
+    """
+
+    def __init__(self):
+        # Checked on every request, the only cost of the profiler when it isn't armed
+        self.active = False
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._instrumented_classes: List[type] = []
+        self._original_methods: Dict[Tuple[type, str], FunctionType] = {}
+
+        self._inflight_requests = 0
+
+        self._cprofile_lock = threading.Lock()
+        self._sampled_threads: Dict[int, str] = {}
+        self._sampler_thread: Optional[threading.Thread] = None
+
+        self.mode = "sampler"
+        self.remaining_requests: Optional[int] = None
+        self.sample_rate = 1.0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.profiled_requests = 0
+            self.stages: Dict[str, Dict[str, float]] = defaultdict(
+                lambda: {"calls": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            self.folded_stacks: Counter = Counter()
+            self.stats: Optional[pstats.Stats] = None
+
+    def instrument(self, cls: type):
+        """
+        Register a class whose public methods are timed as stages of profiled requests
+        :param cls:
+        """
+        self._instrumented_classes.append(cls)
+
+    def start(self, mode: str = "sampler", requests: Optional[int] = None, sample_rate: float = 1.0):
+        """
+        Arm the profiler, discarding any previous results
+        :param mode: sampler or cprofile
+        :param requests: number of requests to profile, or None to profile until stopped
+        :param sample_rate: fraction of requests to profile
+        """
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        if not 0 < sample_rate <= 1:
+            raise ValueError("sample_rate must be greater than 0 and at most 1")
+        if requests is not None and requests < 1:
+            raise ValueError("requests must be at least 1")
+
+        self.reset()
+
+        with self._lock:
+            self.mode = mode
+            self.remaining_requests = requests
+            self.sample_rate = sample_rate
+
+            self._install_stage_timers()
+            self.active = True
+
+    def stop(self):
+        with self._lock:
+            self.active = False
+            if not self._inflight_requests:
+                self._remove_stage_timers()
+
+    def begin_request(self, name: str):
+        """
+        Called at the start of each request while the profiler is active, decides whether to profile the request
+        :param name: stage name for the request as a whole, e.g. GET /events
+        """
+        with self._lock:
+            if not self.active or random.random() >= self.sample_rate:
+                return
+
+            if self.remaining_requests is not None:
+                self.remaining_requests -= 1
+                if self.remaining_requests <= 0:
+                    # Stage timers are removed once the requests already being profiled have finished
+                    self.active = False
+
+            self.profiled_requests += 1
+            self._inflight_requests += 1
+            mode = self.mode
+
+        profile = None
+        if mode == "cprofile":
+            # Only one cProfile profiler can run at a time, concurrent requests are profiled by stage only
+            if self._cprofile_lock.acquire(blocking=False):
+                profile = cProfile.Profile()
+                profile.enable()
+        else:
+            self._start_sampling()
+
+        self._local.request = (name, time.perf_counter(), profile)
+
+    def end_request_on_close(self, response):
+        """
+        Keep profiling a request with a streamed response until the response is closed, rather than when the request
+        is torn down, which Flask does before the body is iterated. WSGI servers iterate and close the response on the
+        request's thread, so its stages, stack samples and cProfile profile cover the stream
+        :param response: streamed flask Response
+        """
+        if getattr(self._local, "request", None) is None:
+            return
+
+        self._local.deferred = True
+        response.call_on_close(self._end_deferred_request)
+
+    def _end_deferred_request(self):
+        self._local.deferred = False
+        self.end_request()
+
+    def end_request(self):
+        if getattr(self._local, "deferred", False):
+            return
+
+        request = getattr(self._local, "request", None)
+        if request is None:
+            return
+        self._local.request = None
+
+        name, start, profile = request
+        if profile:
+            profile.disable()
+            self._cprofile_lock.release()
+
+            with self._lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+        else:
+            self._stop_sampling()
+
+        self.record_stage(name, time.perf_counter() - start)
+
+        with self._lock:
+            self._inflight_requests -= 1
+            if not self.active and not self._inflight_requests:
+                self._remove_stage_timers()
+
+    @property
+    def profiling_request(self) -> bool:
+        return getattr(self._local, "request", None) is not None or getattr(self._local, "propagated", False)
+
+    def propagate(self, function: Callable) -> Callable:
+        """
+        Carry the profiling of the current request over to other threads, e.g. a thread pool querying shards in
+        parallel, so stage timers and the stack sampler cover the work they do for it. cProfile only profiles the
+        request's own thread
+        :param function: function to call in another thread
+        :return: function, wrapped if the current request is being profiled
+        """
+        if not self.profiling_request:
+            return function
+
+        sample = self.mode == "sampler"
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if self.profiling_request:
+                return function(*args, **kwargs)
+
+            self._local.propagated = True
+            if sample:
+                self._start_sampling()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if sample:
+                    self._stop_sampling()
+                self._local.propagated = False
+
+        return wrapper
+
+    def record_stage(self, name: str, seconds: float):
+        with self._lock:
+            stage = self.stages[name]
+            stage["calls"] += 1
+            stage["total_ms"] += seconds * 1000
+            stage["max_ms"] = max(stage["max_ms"], seconds * 1000)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            report = {
+                "active": self.active,
+                "mode": self.mode,
+                "remaining_requests": self.remaining_requests,
+                "sample_rate": self.sample_rate,
+                "profiled_requests": self.profiled_requests,
+                "stages": {name: dict(stage) for name, stage in self.stages.items()},
+            }
+
+            if self.stats is not None:
+                output = io.StringIO()
+                self.stats.stream = output
+                self.stats.sort_stats("cumulative").print_stats(50)
+                report["pstats"] = output.getvalue()
+
+        return report
+
+    def folded(self) -> str:
+        """
+        :return: sampled stacks in folded format, one "stack count" line each, for flamegraph.pl or speedscope
+        """
+        with self._lock:
+            return "\n".join(f"{stack} {count}" for stack, count in sorted(self.folded_stacks.items()))
+
+    def _stage_timer(self, name: str, method: FunctionType):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            if not self.profiling_request:
+                return method(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except BaseException:
+                self.record_stage(name, time.perf_counter() - start)
+                raise
+
+            # Generators and cursors do their work as they are consumed, which is timed too
+            if isinstance(result, Iterator):
+                return _TimedIterator(self, name, result, time.perf_counter() - start)
+
+            self.record_stage(name, time.perf_counter() - start)
+            return result
+
+        return wrapper
+
+    def _install_stage_timers(self):
+        for cls in self._instrumented_classes:
+            for name, method in list(vars(cls).items()):
+                if name.startswith("_") or not isinstance(method, FunctionType):
+                    continue
+                if (cls, name) not in self._original_methods:
+                    self._original_methods[(cls, name)] = method
+                    setattr(cls, name, self._stage_timer(f"{cls.__name__}.{name}", method))
+
+    def _remove_stage_timers(self):
+        for (cls, name), method in self._original_methods.items():
+            setattr(cls, name, method)
+        self._original_methods.clear()
+
+    def _start_sampling(self):
+        with self._lock:
+            self._sampled_threads[threading.get_ident()] = threading.current_thread().name
+
+            if self._sampler_thread is None:
+                self._sampler_thread = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+                self._sampler_thread.start()
+
+    def _stop_sampling(self):
+        with self._lock:
+            self._sampled_threads.pop(threading.get_ident(), None)
+
+    def _sample(self):
+        interval = PROFILING_SAMPLE_INTERVAL_MS / 1000
+
+        while True:
+            time.sleep(interval)
+
+            with self._lock:
+                if not self._sampled_threads:
+                    self._sampler_thread = None
+                    return
+
+                thread_ids = list(self._sampled_threads)
+
+            frames = sys._current_frames()
+            stacks = [_folded_stack(frames[thread_id]) for thread_id in thread_ids if thread_id in frames]
+
+            with self._lock:
+                self.folded_stacks.update(stacks)
+
+
+PROFILER = Profiler()
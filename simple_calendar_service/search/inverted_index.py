@@ -0,0 +1,144 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from datetime import datetime
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+class InvertedIndex:
+    """
+    Pure-Python full-text index over one text field of a set of documents, used where MongoDB text indexes aren't
+    available, e.g. with mongomock. Like a MongoDB $text search, documents match if they contain any of the query's
+    terms, and are ranked by a TF-IDF score
+    """
+
+    def __init__(self, text_field: str, datetime_field: str):
+        self.text_field = text_field
+        self.datetime_field = datetime_field
+
+        self._lock = Lock()
+        # term -> {document _id: term frequency}
+        self._postings: Dict[str, Dict[Any, int]] = defaultdict(dict)
+        self._documents: Dict[Any, Dict[str, Any]] = {}
+        self._terms: Dict[Any, Counter] = {}
+
+    def __len__(self):
+        return len(self._documents)
+
+    def add_documents(self, documents: Iterable[Dict[str, Any]]):
+        """
+        Add documents, replacing any already indexed with the same _id
+        :param documents:
+        """
+        with self._lock:
+            for document in documents:
+                self._remove(document["_id"])
+
+                terms = Counter(tokenize(document.get(self.text_field)))
+                for term, frequency in terms.items():
+                    self._postings[term][document["_id"]] = frequency
+
+                self._documents[document["_id"]] = document
+                self._terms[document["_id"]] = terms
+
+    def remove_document(self, document_id: Any):
+        with self._lock:
+            self._remove(document_id)
+
+    def _remove(self, document_id: Any):
+        for term in self._terms.pop(document_id, ()):
+            postings = self._postings[term]
+            postings.pop(document_id, None)
+            if not postings:
+                del self._postings[term]
+
+        self._documents.pop(document_id, None)
+
+    def search(
+        self,
+        query: str,
+        datetime_lower: Optional[datetime] = None,
+        datetime_upper: Optional[datetime] = None,
+        skip: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Search documents by text, optionally within [datetime_lower, datetime_upper)
+        :param query:
+        :param datetime_lower:
+        :param datetime_upper:
+        :param skip: number of ranked results to skip, for pagination
+        :param limit: maximum number of results to return
+        :return: matching documents, with their relevance as "score", ordered by descending score then time
+        """
+        with self._lock:
+            scores: Dict[Any, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+
+                idf = math.log(1 + len(self._documents) / len(postings))
+                for document_id, frequency in postings.items():
+                    scores[document_id] += frequency * idf
+
+            candidates = []
+            for document_id, score in scores.items():
+                document = self._documents[document_id]
+                time = document[self.datetime_field]
+                if (datetime_lower and time < datetime_lower) or (datetime_upper and time >= datetime_upper):
+                    continue
+
+                candidates.append((-score, time, document_id))
+
+            # Only the top skip + limit results need to be ordered
+            if limit is None:
+                ranked = sorted(candidates)
+            else:
+                ranked = heapq.nsmallest(skip + limit, candidates)
+
+            # Documents are read under the lock, as a concurrent write may replace or remove them
+            return [
+                {**self._documents[document_id], "score": -negative_score}
+                for negative_score, _, document_id in ranked[skip:]
+            ]
+
+
+_inverted_indexes: Dict[Tuple[str, str], InvertedIndex] = {}
+_inverted_indexes_lock = Lock()
+
+
+def get_inverted_index(
+    key: Tuple[str, str],
+    text_field: str,
+    datetime_field: str,
+    load_documents: Callable[[], Iterable[Dict[str, Any]]],
+) -> InvertedIndex:
+    """
+    Process-wide inverted index, built from load_documents on first use
+    :param key: identifies the indexed collection, e.g. (database, collection)
+    :param text_field:
+    :param datetime_field:
+    :param load_documents:
+    :return:
+    """
+    with _inverted_indexes_lock:
+        if key not in _inverted_indexes:
+            inverted_index = InvertedIndex(text_field, datetime_field)
+            inverted_index.add_documents(load_documents())
+            _inverted_indexes[key] = inverted_index
+
+        return _inverted_indexes[key]
+
+
+def clear_inverted_indexes():
+    with _inverted_indexes_lock:
+        _inverted_indexes.clear()
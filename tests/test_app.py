@@ -1,7 +1,12 @@
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
 import json
+from unittest import mock
 
-from app import app
+from app import app, create_app
 
 
 class TestApp(unittest.TestCase):
@@ -19,3 +24,79 @@ class TestApp(unittest.TestCase):
         self.assertEqual(
             json.loads(response.data), {"Message": "Health endpoint is reachable"}
         )
+
+
+class TestCreateApp(unittest.TestCase):
+    def test_docs_disabled(self):
+        client = create_app(docs_enabled=False).test_client()
+
+        self.assertEqual(client.get("/health").status_code, 200)
+        self.assertEqual(client.get("/apidocs/").status_code, 404)
+        self.assertEqual(client.get("/apispec_1.json").status_code, 404)
+
+    def test_docs_enabled(self):
+        client = create_app(docs_enabled=True).test_client()
+
+        response = client.get("/apispec_1.json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("/events", json.loads(response.data)["paths"])
+
+    def test_spec_cache(self):
+        with tempfile.TemporaryDirectory() as spec_cache_path:
+            client = create_app(docs_enabled=True, spec_cache_path=spec_cache_path).test_client()
+            spec = json.loads(client.get("/apispec_1.json").data)
+
+            cached_files = os.listdir(spec_cache_path)
+            self.assertEqual(len(cached_files), 1)
+
+            # A fresh app is served the cached spec without parsing docstrings again
+            with mock.patch("flasgger.Swagger.get_apispecs") as mocked_get_apispecs:
+                client = create_app(docs_enabled=True, spec_cache_path=spec_cache_path).test_client()
+                self.assertEqual(json.loads(client.get("/apispec_1.json").data), spec)
+                mocked_get_apispecs.assert_not_called()
+
+    def test_corrupt_spec_cache(self):
+        with tempfile.TemporaryDirectory() as spec_cache_path:
+            client = create_app(docs_enabled=True, spec_cache_path=spec_cache_path).test_client()
+            spec = json.loads(client.get("/apispec_1.json").data)
+
+            (cached_file,) = os.listdir(spec_cache_path)
+            with open(os.path.join(spec_cache_path, cached_file), "w") as spec_file:
+                spec_file.write('{"openapi": ')
+
+            # A truncated cache file is regenerated rather than failing the request
+            client = create_app(docs_enabled=True, spec_cache_path=spec_cache_path).test_client()
+            response = client.get("/apispec_1.json")
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.data), spec)
+            self.assertEqual(os.listdir(spec_cache_path), [cached_file])
+            with open(os.path.join(spec_cache_path, cached_file)) as spec_file:
+                self.assertEqual(json.load(spec_file), spec)
+
+    def test_metrics(self):
+        client = create_app(docs_enabled=False).test_client()
+
+        response = client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(json.loads(response.data), dict)
+
+    def test_deferred_imports(self):
+        # Run in a fresh interpreter, as other tests have already imported everything
+        completed = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import sys, app; print(','.join(sorted(m for m in sys.modules if m == 'pydantic.json' or "
+                "m.split('.')[0] in ('flasgger', 'pymongo', 'zstandard', 'brotli', 'pyarrow', 'msgpack'))))",
+            ],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env={**os.environ, "SWAGGER_ENABLED": "false"},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        self.assertEqual(completed.stdout.strip(), "")
@@ -0,0 +1,219 @@
+import json
+import unittest
+from datetime import datetime
+from threading import Event as ThreadEvent
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from unittest.mock import MagicMock
+
+from simple_calendar_service.controller import admission
+from simple_calendar_service.controller.export import is_installed
+from simple_calendar_service.db.dao.event import QueryTimeoutError
+from simple_calendar_service.dto.event import Event
+
+
+class TestAdmission(unittest.TestCase):
+    def setUp(self):
+        from app import app
+
+        self.app = app
+        self.events = [Event(id=1, time=datetime(2024, 1, 1))]
+
+    def mock_dao(self, mocked_dao) -> MagicMock:
+        mocked_instance = MagicMock()
+        mocked_instance.get_events_by_time_range.return_value = self.events
+        mocked_dao.return_value = mocked_instance
+
+        return mocked_instance
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_admitted(self, mocked_dao):
+        mocked_instance = self.mock_dao(mocked_dao)
+
+        with self.app.test_client() as client:
+            res = client.get("/events?from_time=2024-01-01T00:00:00&to_time=2024-02-01T00:00:00")
+
+        self.assertEqual(res.status_code, 200)
+        mocked_instance.get_events_by_time_range.assert_called_once_with(
+            "2024-01-01T00:00:00", "2024-02-01T00:00:00", max_time_ms=30000
+        )
+        # Count estimate is disabled by default
+        mocked_instance.count_events_by_time_range.assert_not_called()
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_range_too_large(self, mocked_dao):
+        mocked_instance = self.mock_dao(mocked_dao)
+
+        with self.app.test_client() as client:
+            res = client.get("/events?from_time=2020-01-01T00:00:00&to_time=2024-01-01T00:00:00")
+
+        self.assertEqual(res.status_code, 413)
+        self.assertIn("split it into ranges of at most 366 days", json.loads(res.data)["message"])
+        mocked_instance.get_events_by_time_range.assert_not_called()
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_invalid_time(self, mocked_dao):
+        self.mock_dao(mocked_dao)
+
+        with self.app.test_client() as client:
+            res = client.get("/events?from_time=yesterday")
+
+        self.assertEqual(res.status_code, 400)
+
+    @mock.patch.object(admission, "ADMISSION_MAX_EVENTS", 100)
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_too_many_events(self, mocked_dao):
+        mocked_instance = self.mock_dao(mocked_dao)
+        mocked_instance.count_events_by_time_range.return_value = 101
+
+        with self.app.test_client() as client:
+            res = client.get("/events?from_time=2024-01-01T00:00:00&to_time=2024-02-01T00:00:00")
+
+        self.assertEqual(res.status_code, 413)
+        mocked_instance.count_events_by_time_range.assert_called_once_with(
+            "2024-01-01T00:00:00", "2024-02-01T00:00:00", limit=101, max_time_ms=30000
+        )
+        mocked_instance.get_events_by_time_range.assert_not_called()
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_query_timeout(self, mocked_dao):
+        mocked_instance = self.mock_dao(mocked_dao)
+        mocked_instance.get_events_by_time_range.side_effect = QueryTimeoutError("Query exceeded 30000ms")
+
+        with self.app.test_client() as client:
+            res = client.get("/events")
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers["Retry-After"], "1")
+
+    @mock.patch.object(admission, "ADMISSION_TRUST_CLIENT_ID_HEADER", True)
+    @mock.patch.object(admission, "ADMISSION_MAX_CONCURRENT_PER_CLIENT", 1)
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_client_concurrency(self, mocked_dao):
+        started = ThreadEvent()
+        release = ThreadEvent()
+
+        def slow_query(*args, **kwargs):
+            if not started.is_set():
+                started.set()
+                release.wait()
+            return self.events
+
+        mocked_instance = self.mock_dao(mocked_dao)
+        mocked_instance.get_events_by_time_range.side_effect = slow_query
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            first = executor.submit(
+                lambda: self.app.test_client().get("/events", headers={"X-Client-Id": "client-1"})
+            )
+            started.wait()
+
+            with self.app.test_client() as client:
+                rejected = client.get("/events", headers={"X-Client-Id": "client-1"})
+                other_client = client.get("/events", headers={"X-Client-Id": "client-2"})
+
+            release.set()
+
+            self.assertEqual(first.result().status_code, 200)
+
+        self.assertEqual(rejected.status_code, 429)
+        self.assertEqual(rejected.headers["Retry-After"], "1")
+        self.assertEqual(other_client.status_code, 200)
+
+    def test_inflight_days_budget(self):
+        controller = admission.AdmissionController()
+
+        self.assertIsNone(controller.try_acquire("client-1", 400))
+        self.assertIsNotNone(controller.try_acquire("client-1", 400))
+        self.assertIsNone(controller.try_acquire("client-1", 300))
+
+        controller.release("client-1", 400)
+        controller.release("client-1", 300)
+
+        self.assertIsNone(controller.try_acquire("client-1", 400))
+
+    @mock.patch.object(admission, "ADMISSION_MAX_CONCURRENT", 2)
+    @mock.patch.object(admission, "ADMISSION_MAX_INFLIGHT_DAYS", 1000)
+    def test_global_budget(self):
+        controller = admission.AdmissionController()
+
+        self.assertIsNone(controller.try_acquire("client-1", 400))
+        self.assertEqual(controller.try_acquire("client-2", 700)[0], "global_budget")
+        self.assertIsNone(controller.try_acquire("client-2", 400))
+        # Every client is turned away once the process is at its limit
+        self.assertEqual(controller.try_acquire("client-3", 1)[0], "global_budget")
+
+        controller.release("client-1", 400)
+
+        self.assertIsNone(controller.try_acquire("client-3", 1))
+
+    def test_client_id(self):
+        headers = {"X-Client-Id": "client-1", "X-Forwarded-For": "10.0.0.1, 10.0.0.2"}
+
+        with self.app.test_request_context(headers=headers, environ_base={"REMOTE_ADDR": "10.0.0.3"}):
+            # Clients could otherwise pick a new X-Client-Id per request to dodge their budget
+            self.assertEqual(admission.get_client_id(), "10.0.0.3")
+
+            with mock.patch.object(admission, "ADMISSION_TRUSTED_PROXY_HOPS", 1):
+                self.assertEqual(admission.get_client_id(), "10.0.0.2")
+
+            with mock.patch.object(admission, "ADMISSION_TRUSTED_PROXY_HOPS", 3):
+                self.assertEqual(admission.get_client_id(), "10.0.0.3")
+
+            with mock.patch.object(admission, "ADMISSION_TRUST_CLIENT_ID_HEADER", True):
+                self.assertEqual(admission.get_client_id(), "client-1")
+
+    @unittest.skipUnless(is_installed("msgpack"), "msgpack not installed")
+    @mock.patch.object(admission, "ADMISSION_MAX_CONCURRENT_PER_CLIENT", 1)
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_export_holds_budget_while_streaming(self, mocked_dao):
+        mocked_instance = self.mock_dao(mocked_dao)
+        mocked_instance.get_event_batches_by_time_range.return_value = iter([])
+
+        with self.app.test_client() as client:
+            export = client.get("/events/export", headers={"Accept": "application/msgpack"})
+            self.assertEqual(export.status_code, 200)
+
+            self.assertEqual(client.get("/events").status_code, 429)
+
+            export.close()
+
+            self.assertEqual(client.get("/events").status_code, 200)
+
+        mocked_instance.get_event_batches_by_time_range.assert_called_once_with(
+            None, None, batch_size=10000, max_time_ms=300000
+        )
+
+    @unittest.skipUnless(is_installed("msgpack"), "msgpack not installed")
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_export_range_too_large(self, mocked_dao):
+        mocked_instance = self.mock_dao(mocked_dao)
+
+        with self.app.test_client() as client:
+            allowed = client.get(
+                "/events/export?from_time=2020-01-01T00:00:00&to_time=2024-01-01T00:00:00",
+                headers={"Accept": "application/msgpack"},
+                buffered=True,
+            )
+            rejected = client.get(
+                "/events/export?from_time=2000-01-01T00:00:00&to_time=2024-01-01T00:00:00",
+                headers={"Accept": "application/msgpack"},
+            )
+
+        # Exports have their own, larger, range limit
+        self.assertEqual(allowed.status_code, 200)
+        self.assertEqual(rejected.status_code, 413)
+        self.assertIn("at most 3660 days", json.loads(rejected.data)["message"])
+        mocked_instance.get_event_batches_by_time_range.assert_called_once()
+
+    @mock.patch.object(admission, "ADMISSION_MAX_CONCURRENT", 0)
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_search_admission(self, mocked_dao):
+        mocked_instance = self.mock_dao(mocked_dao)
+
+        with self.app.test_client() as client:
+            res = client.get("/events/search?q=test")
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers["Retry-After"], "1")
+        mocked_instance.search_events.assert_not_called()
@@ -0,0 +1,107 @@
+import gzip
+import json
+import unittest
+from datetime import datetime
+from unittest import mock
+from unittest.mock import MagicMock
+
+import flask
+
+from simple_calendar_service.controller import compression
+from simple_calendar_service.controller.compression import compress_response
+from simple_calendar_service.dto.event import Event
+from simple_calendar_service.metrics import METRICS
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        from app import app
+
+        self.app = app
+        self.events = [
+            Event(
+                id=i,
+                description="test description",
+                time=datetime.strptime("2024-01-01T00:00:00", "%Y-%m-%dT%H:%M:%S"),
+            )
+            for i in range(100)
+        ]
+        METRICS.reset()
+
+    def get_events(self, mocked_dao, headers):
+        mocked_instance = MagicMock()
+        mocked_instance.get_events_by_time_range.return_value = self.events
+        mocked_dao.return_value = mocked_instance
+
+        with self.app.test_client() as client:
+            return client.get("/events", headers=headers)
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_gzip(self, mocked_dao):
+        res = self.get_events(mocked_dao, {"Accept-Encoding": "gzip"})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", res.headers["Vary"])
+        self.assertEqual(len(json.loads(gzip.decompress(res.data))["retrievedEvents"]), 100)
+
+        self.assertEqual(METRICS.get("compression_responses_total", encoding="gzip"), 1)
+        self.assertGreater(METRICS.get("compression_ratio", encoding="gzip"), 1)
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_no_accept_encoding(self, mocked_dao):
+        res = self.get_events(mocked_dao, {})
+
+        self.assertNotIn("Content-Encoding", res.headers)
+        self.assertEqual(len(json.loads(res.data)["retrievedEvents"]), 100)
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_below_min_size(self, mocked_dao):
+        with mock.patch.object(compression, "COMPRESSION_MIN_SIZE", 10**9):
+            res = self.get_events(mocked_dao, {"Accept-Encoding": "gzip"})
+
+        self.assertNotIn("Content-Encoding", res.headers)
+        self.assertEqual(METRICS.snapshot(), {})
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_quality_values(self, mocked_dao):
+        res = self.get_events(mocked_dao, {"Accept-Encoding": "gzip;q=0, identity"})
+
+        self.assertNotIn("Content-Encoding", res.headers)
+
+    @unittest.skipIf(not compression.ZSTANDARD_INSTALLED, "zstandard not installed")
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_zstd(self, mocked_dao):
+        res = self.get_events(mocked_dao, {"Accept-Encoding": "gzip, br, zstd"})
+
+        self.assertEqual(res.headers["Content-Encoding"], "zstd")
+        import zstandard
+
+        decompressed = zstandard.ZstdDecompressor().decompressobj().decompress(res.data)
+        self.assertEqual(len(json.loads(decompressed)["retrievedEvents"]), 100)
+
+    @unittest.skipIf(not compression.BROTLI_INSTALLED, "brotli not installed")
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_brotli(self, mocked_dao):
+        res = self.get_events(mocked_dao, {"Accept-Encoding": "gzip;q=0.5, br"})
+
+        import brotli
+
+        self.assertEqual(res.headers["Content-Encoding"], "br")
+        self.assertEqual(len(json.loads(brotli.decompress(res.data))["retrievedEvents"]), 100)
+
+    def test_streamed_response(self):
+        app = flask.Flask(__name__)
+        app.after_request(compress_response)
+
+        @app.route("/stream")
+        def stream():
+            return flask.Response((f"chunk-{i}\n" for i in range(10)))
+
+        with app.test_client() as client:
+            res = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(res.headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", res.headers)
+        self.assertEqual(gzip.decompress(res.data).decode(), "".join(f"chunk-{i}\n" for i in range(10)))
+        self.assertEqual(METRICS.get("compression_responses_total", encoding="gzip"), 1)
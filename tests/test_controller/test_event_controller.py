@@ -5,7 +5,11 @@ from datetime import datetime
 from unittest import mock
 from unittest.mock import MagicMock
 
+import mongomock
+from bson import Timestamp
+
 from simple_calendar_service.controller.event_controller import DAO
+from simple_calendar_service.db.mongodb_client import encode_causal_token
 from simple_calendar_service.dto.event import Event
 
 class TestEventController(unittest.TestCase):
@@ -131,3 +135,113 @@ class TestEventController(unittest.TestCase):
 
         self.assertTrue(all([event["time"] == "2024-01-01" for event in [event for event in json.loads(res.data)["retrievedEvents"]]]))
         self.assertTrue(res.status_code, 200)
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_causal_token(self, mocked_dao):
+        session = MagicMock(operation_time=Timestamp(1704067200, 1), cluster_time={"clusterTime": Timestamp(1704067200, 1)})
+        token = encode_causal_token(session)
+
+        mocked_instance = MagicMock()
+        mocked_instance.create_events.return_value = {"created": self.events, "updated": []}
+        mocked_instance.causal_token = token
+        mocked_instance.get_event_by_id.return_value = None
+        mocked_dao.return_value = mocked_instance
+
+        with self.app.test_client() as client:
+            res = client.post("/events", json=self.events)
+            self.assertEqual(res.headers["X-Causal-Token"], token)
+
+            client.get("/event/1", headers={"X-Causal-Token": res.headers["X-Causal-Token"]})
+
+        self.assertEqual(mocked_dao.call_args.kwargs["causal_token"], token)
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_invalid_causal_token(self, mocked_dao):
+        headers = {"X-Causal-Token": "garbage"}
+
+        with self.app.test_client() as client:
+            responses = [
+                client.get("/event/1", headers=headers),
+                client.get("/events?from_time=2024-01-01T00:00:00&to_time=2024-01-02T00:00:00", headers=headers),
+                client.get("/events/export?from_time=2024-01-01T00:00:00", headers=headers),
+                client.get("/events/search?q=meeting", headers=headers),
+                client.post("/events", json=self.events, headers=headers),
+            ]
+
+        for res in responses:
+            self.assertEqual(res.status_code, 400)
+            self.assertTrue(json.loads(res.data)["message"].startswith("Invalid X-Causal-Token header"))
+
+        mocked_dao.assert_not_called()
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_search_events(self, mocked_dao):
+        mocked_instance = MagicMock()
+        mocked_instance.search_events.return_value = (
+            [(Event(id=1, description="team meeting", time=datetime(2024, 1, 1)), 1.5)],
+            True,
+        )
+        mocked_dao.return_value = mocked_instance
+
+        with self.app.test_client() as client:
+            res = client.get("/events/search?q=meeting&page=2&page_size=1&datetime_format=%Y-%m-%d")
+
+        self.assertEqual(res.status_code, 200)
+        body = json.loads(res.data)
+        self.assertEqual(body["results"], [{"id": 1, "description": "team meeting", "time": "2024-01-01", "score": 1.5}])
+        self.assertEqual((body["page"], body["pageSize"], body["hasMore"]), (2, 1, True))
+        self.assertEqual(mocked_instance.search_events.call_args.kwargs["page"], 2)
+        self.assertEqual(mocked_instance.search_events.call_args.kwargs["page_size"], 1)
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_search_events_invalid_request(self, mocked_dao):
+        with self.app.test_client() as client:
+            self.assertEqual(client.get("/events/search").status_code, 400)
+            self.assertEqual(client.get("/events/search?q=meeting&page=0").status_code, 400)
+            self.assertEqual(client.get("/events/search?q=meeting&page_size=1000").status_code, 400)
+            self.assertEqual(client.get("/events/search?q=meeting&page=51").status_code, 400)
+            self.assertEqual(client.get(f"/events/search?q=meeting&page={10 ** 17}").status_code, 400)
+
+            res = client.get("/events/search?q=meeting&from_time=yesterday")
+            self.assertEqual(res.status_code, 400)
+            self.assertTrue(json.loads(res.data)["message"].startswith("Error parsing from_time or to_time: "))
+
+        mocked_dao.assert_not_called()
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_search_events_error(self, mocked_dao):
+        mocked_dao.return_value.search_events.side_effect = ValueError("invalid document")
+
+        # Only invalid time ranges are reported as parse errors, other errors aren't turned into a 400
+        with self.app.test_client() as client, self.assertRaises(ValueError):
+            client.get("/events/search?q=meeting&from_time=2024-01-01T00:00:00")
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_search_events_timeout(self, mocked_dao):
+        from simple_calendar_service.db.dao.event import QueryTimeoutError
+
+        mocked_dao.return_value.search_events.side_effect = QueryTimeoutError("operation exceeded time limit")
+
+        with self.app.test_client() as client:
+            res = client.get("/events/search?q=meeting")
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers["Retry-After"], "1")
+
+    def test_invalid_sharded_causal_token(self):
+        backends = {name: mongomock.MongoClient(f"mongodb://controller-shard-{name}") for name in ("a", "b")}
+        headers = {"X-Causal-Token": "garbage"}
+
+        with mock.patch("simple_calendar_service.db.dao.event.MONGODB_SHARDS", "a=mongodb://a;b=mongodb://b"), mock.patch(
+            "simple_calendar_service.db.dao.event.get_shard_clients", return_value=backends
+        ):
+            with self.app.test_client() as client:
+                responses = [
+                    client.get("/event/1", headers=headers),
+                    client.get("/events/search?q=meeting", headers=headers),
+                    client.post("/events", json=self.events, headers=headers),
+                ]
+
+        for res in responses:
+            self.assertEqual(res.status_code, 400)
+            self.assertTrue(json.loads(res.data)["message"].startswith("Invalid X-Causal-Token header"))
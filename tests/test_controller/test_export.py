@@ -0,0 +1,79 @@
+import io
+import json
+import unittest
+from unittest import mock
+from unittest.mock import MagicMock
+
+from simple_calendar_service.controller.export import (
+    ARROW_STREAM_MIMETYPE,
+    MSGPACK_MIMETYPE,
+    is_installed,
+)
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        from app import app
+
+        self.app = app
+        self.batches = [
+            {"id": [1, 2], "description": ["test-1", None], "time": [1704067200000, 1704153600000]},
+            {"id": [3], "description": ["test-3"], "time": [1704240000000]},
+        ]
+
+    def export(self, mocked_dao, headers, query=""):
+        mocked_instance = MagicMock()
+        mocked_instance.get_event_batches_by_time_range.return_value = iter(self.batches)
+        mocked_dao.return_value = mocked_instance
+
+        with self.app.test_client() as client:
+            # Buffered so the streamed response is closed, releasing its admission budget
+            return client.get(f"/events/export{query}", headers=headers, buffered=True)
+
+    @unittest.skipUnless(is_installed("pyarrow"), "pyarrow not installed")
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_export_arrow(self, mocked_dao):
+        import pyarrow.ipc
+
+        res = self.export(mocked_dao, {"Accept": ARROW_STREAM_MIMETYPE})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, ARROW_STREAM_MIMETYPE)
+
+        table = pyarrow.ipc.open_stream(io.BytesIO(res.data)).read_all()
+        self.assertEqual(table.column("id").to_pylist(), [1, 2, 3])
+        self.assertEqual(table.column("description").to_pylist(), ["test-1", None, "test-3"])
+        self.assertEqual(
+            table.column("time").cast("int64").to_pylist(),
+            [1704067200000, 1704153600000, 1704240000000],
+        )
+
+    @unittest.skipUnless(is_installed("msgpack"), "msgpack not installed")
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_export_msgpack(self, mocked_dao):
+        import msgpack
+
+        res = self.export(mocked_dao, {"Accept": MSGPACK_MIMETYPE}, "?from_time=2024-01-01T00:00:00")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, MSGPACK_MIMETYPE)
+        self.assertEqual(list(msgpack.Unpacker(io.BytesIO(res.data))), self.batches)
+
+        mocked_dao.return_value.get_event_batches_by_time_range.assert_called_once_with(
+            "2024-01-01T00:00:00", None, batch_size=10000, max_time_ms=300000
+        )
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_export_unsupported_format(self, mocked_dao):
+        res = self.export(mocked_dao, {"Accept": "text/csv"})
+
+        self.assertEqual(res.status_code, 406)
+
+    @mock.patch("simple_calendar_service.controller.event_controller.DAO")
+    def test_export_invalid_time(self, mocked_dao):
+        with self.app.test_client() as client:
+            res = client.get("/events/export?from_time=yesterday", headers={"Accept": MSGPACK_MIMETYPE})
+
+        self.assertEqual(res.status_code, 400)
+        self.assertTrue(json.loads(res.data)["message"].startswith("Error parsing from_time or to_time: "))
+        mocked_dao.assert_not_called()
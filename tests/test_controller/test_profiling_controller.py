@@ -0,0 +1,136 @@
+import json
+import time
+import unittest
+from unittest import mock
+
+import mongomock
+
+from simple_calendar_service.controller import profiling_controller
+from simple_calendar_service.controller.export import MSGPACK_MIMETYPE, is_installed
+from simple_calendar_service.db.dao.event import EventDAO
+from simple_calendar_service.db.mongodb_client import MongoDBClient
+from simple_calendar_service.profiling import PROFILER
+
+ADMIN_HEADERS = {"Authorization": "Bearer secret"}
+
+
+@mock.patch.object(profiling_controller, "PROFILING_ADMIN_TOKEN", "secret")
+class TestProfilingController(unittest.TestCase):
+    def setUp(self):
+        from app import app
+
+        self.app = app
+        self.mongo_client = mongomock.MongoClient()
+        self.events = [
+            {"id": 1, "description": "test-1", "time": "2024-01-01T00:00:00"},
+            {"id": 2, "description": "test-2", "time": "2024-01-02T00:00:00"},
+        ]
+
+    def tearDown(self):
+        PROFILER.stop()
+        PROFILER.reset()
+
+    def dao(self, **kwargs):
+        return EventDAO(
+            database="test-db",
+            collection="test-collection",
+            client=MongoDBClient(database="test-db", collection="test-collection", client=self.mongo_client),
+        )
+
+    def test_authentication(self):
+        with self.app.test_client() as client:
+            self.assertEqual(client.get("/admin/profiling").status_code, 401)
+            self.assertEqual(
+                client.get("/admin/profiling", headers={"Authorization": "Bearer wrong"}).status_code, 401
+            )
+            self.assertEqual(
+                client.get("/admin/profiling", headers={"Authorization": "Bearer sécret"}).status_code, 401
+            )
+            self.assertEqual(client.get("/admin/profiling", headers=ADMIN_HEADERS).status_code, 200)
+
+        with mock.patch.object(profiling_controller, "PROFILING_ADMIN_TOKEN", None):
+            with self.app.test_client() as client:
+                self.assertEqual(client.get("/admin/profiling", headers=ADMIN_HEADERS).status_code, 404)
+
+    def test_invalid_options(self):
+        with self.app.test_client() as client:
+            res = client.post("/admin/profiling", json={"mode": "perf"}, headers=ADMIN_HEADERS)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(PROFILER.active)
+
+    def test_profile_next_requests(self):
+        with mock.patch("simple_calendar_service.controller.event_controller.DAO", side_effect=self.dao):
+            with self.app.test_client() as client:
+                res = client.post("/admin/profiling", json={"mode": "cprofile", "requests": 2}, headers=ADMIN_HEADERS)
+                self.assertEqual(res.status_code, 200)
+                self.assertTrue(json.loads(res.data)["active"])
+
+                client.post("/events", json=self.events)
+                client.get("/event/1")
+                # Only the next 2 requests are profiled
+                client.get("/event/2")
+
+                report = json.loads(client.get("/admin/profiling", headers=ADMIN_HEADERS).data)
+
+        self.assertFalse(report["active"])
+        self.assertEqual(report["profiled_requests"], 2)
+        self.assertEqual(report["stages"]["POST /events"]["calls"], 1)
+        self.assertEqual(report["stages"]["GET /event/<int:id>"]["calls"], 1)
+        self.assertEqual(report["stages"]["EventDAO.create_events"]["calls"], 1)
+        self.assertEqual(report["stages"]["MongoDBClient.get_document"]["calls"], 1)
+        self.assertIn("create_events", report["pstats"])
+
+        # Stage timers are removed once profiling finishes
+        self.assertFalse(hasattr(EventDAO.create_events, "__wrapped__"))
+
+    def test_sampler(self):
+        with mock.patch.object(PROFILER, "_sample") as sample:
+            with mock.patch("simple_calendar_service.controller.event_controller.DAO", side_effect=self.dao):
+                with self.app.test_client() as client:
+                    client.post("/admin/profiling", json={"requests": 1}, headers=ADMIN_HEADERS)
+                    client.get("/event/1")
+
+        sample.assert_called_once()
+
+        PROFILER.folded_stacks.update(["app.py:main;event.py:EventDAO.get_event_by_id"] * 3)
+        with self.app.test_client() as client:
+            res = client.get("/admin/profiling?format=folded", headers=ADMIN_HEADERS)
+
+        self.assertEqual(res.data.decode(), "app.py:main;event.py:EventDAO.get_event_by_id 3")
+
+    def test_stop(self):
+        with self.app.test_client() as client:
+            client.post("/admin/profiling", json={"sample_rate": 0.5}, headers=ADMIN_HEADERS)
+            self.assertTrue(PROFILER.active)
+            self.assertTrue(hasattr(EventDAO.create_events, "__wrapped__"))
+
+            res = client.delete("/admin/profiling", headers=ADMIN_HEADERS)
+
+        self.assertFalse(json.loads(res.data)["active"])
+        self.assertFalse(hasattr(EventDAO.create_events, "__wrapped__"))
+
+    @unittest.skipUnless(is_installed("msgpack"), "msgpack not installed")
+    def test_streamed_response(self):
+        def slow_batches(*args, **kwargs):
+            for i in range(1, 3):
+                time.sleep(0.05)
+                yield {"id": [i], "description": [f"test-{i}"], "time": [1704067200000]}
+
+        with mock.patch("simple_calendar_service.controller.event_controller.DAO") as mocked_dao:
+            mocked_dao.return_value.get_event_batches_by_time_range.side_effect = slow_batches
+
+            with self.app.test_client() as client:
+                client.post("/admin/profiling", json={"mode": "cprofile", "requests": 1}, headers=ADMIN_HEADERS)
+
+                res = client.get("/events/export", headers={"Accept": MSGPACK_MIMETYPE})
+                # The request is still being profiled while its response streams
+                self.assertNotIn("GET /events/export", PROFILER.report()["stages"])
+
+                res.get_data()
+                res.close()
+
+        report = PROFILER.report()
+        self.assertEqual(report["stages"]["GET /events/export"]["calls"], 1)
+        self.assertGreaterEqual(report["stages"]["GET /events/export"]["total_ms"], 100)
+        self.assertIn("slow_batches", report["pstats"])
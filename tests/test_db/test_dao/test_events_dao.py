@@ -2,8 +2,13 @@ import unittest
 from datetime import datetime
 from unittest.mock import patch, MagicMock
 
-from simple_calendar_service.db.dao.event import EventDAO
+import mongomock
+import pymongo
+
+from simple_calendar_service.db.dao.event import EventDAO, QueryTimeoutError
+from simple_calendar_service.db.sharded_mongodb_client import ShardedMongoDBClient
 from simple_calendar_service.dto.event import Event
+from simple_calendar_service.search.inverted_index import clear_inverted_indexes
 
 
 class TestEventDAO(unittest.TestCase):
@@ -95,3 +100,124 @@ class TestEventDAO(unittest.TestCase):
         self.assertEqual(
             to_time, datetime.strptime("2024-01-02T00:00:00", "%Y-%m-%dT%H:%M:%S")
         )
+
+    @patch("simple_calendar_service.db.mongodb_client.MongoDBClient")
+    def test_get_event_batches_by_time_range(self, mocked_db_client: MagicMock):
+        mocked_result = [
+            {
+                "id": i,
+                "description": f"test-{i}",
+                "time": datetime.strptime(f"2024-01-0{i}T00:00:00", "%Y-%m-%dT%H:%M:%S"),
+            }
+            for i in range(1, 4)
+        ]
+
+        mocked_db_client.get_documents_by_date_range.return_value = iter(mocked_result)
+
+        res = EventDAO(database="test-db", collection="test-col", client=mocked_db_client).get_event_batches_by_time_range(
+            from_time="2024-01-01T00:00:00", to_time="2024-01-04T00:00:00", batch_size=2
+        )
+
+        self.assertEqual(
+            list(res),
+            [
+                {"id": [1, 2], "description": ["test-1", "test-2"], "time": [1704067200000, 1704153600000]},
+                {"id": [3], "description": ["test-3"], "time": [1704240000000]},
+            ],
+        )
+        self.assertEqual(mocked_db_client.get_documents_by_date_range.call_args.kwargs["batch_size"], 2)
+
+        with self.assertRaises(ValueError):
+            EventDAO(database="test-db", collection="test-col", client=mocked_db_client).get_event_batches_by_time_range(
+                from_time="2024-01-01"
+            )
+
+    @patch("simple_calendar_service.db.mongodb_client.MongoDBClient")
+    def test_get_event_batches_by_time_range_timeout(self, mocked_db_client: MagicMock):
+        def timed_out_cursor():
+            yield {"id": 1, "description": "test-1", "time": datetime(2024, 1, 1)}
+            raise pymongo.errors.ExecutionTimeout("operation exceeded time limit")
+
+        mocked_db_client.get_documents_by_date_range.return_value = timed_out_cursor()
+
+        res = EventDAO(database="test-db", collection="test-col", client=mocked_db_client).get_event_batches_by_time_range(
+            from_time="2024-01-01T00:00:00", batch_size=1, max_time_ms=1000
+        )
+
+        self.assertEqual(next(res)["id"], [1])
+        with self.assertRaises(QueryTimeoutError):
+            next(res)
+        self.assertEqual(mocked_db_client.get_documents_by_date_range.call_args.kwargs["max_time_ms"], 1000)
+
+    @patch("simple_calendar_service.db.mongodb_client.MongoDBClient")
+    def test_search_events(self, mocked_db_client: MagicMock):
+        mocked_db_client.search_documents.return_value = [
+            {"_id": i, "id": i, "description": "test", "time": datetime(2024, 1, i), "score": 1.0}
+            for i in range(1, 4)
+        ]
+
+        res, has_more = EventDAO(database="test-db", collection="test-col", client=mocked_db_client).search_events(
+            "test", from_time="2024-01-01T00:00:00", page=2, page_size=2, max_time_ms=1000
+        )
+
+        self.assertEqual(res, [(Event(id=1, description="test", time=datetime(2024, 1, 1)), 1.0),
+                               (Event(id=2, description="test", time=datetime(2024, 1, 2)), 1.0)])
+        self.assertTrue(has_more)
+        mocked_db_client.create_text_index.assert_called_once_with("description")
+        mocked_db_client.search_documents.assert_called_once_with(
+            "test",
+            datetime_field="time",
+            datetime_lower=datetime(2024, 1, 1),
+            datetime_upper=None,
+            skip=2,
+            limit=3,
+            max_time_ms=1000,
+        )
+
+    @mongomock.patch(servers=(("localhost", 27017),))
+    def test_search_events_in_memory(self):
+        clear_inverted_indexes()
+        pymongo.MongoClient(host="localhost", port=27017)["test-db"]["test-col"].drop()
+
+        dao = EventDAO(database="test-db", collection="test-col")
+        dao.create_events(
+            events=[
+                Event(id=1, description="Team meeting", time=datetime(2024, 1, 1)),
+                Event(id=2, description="Dentist", time=datetime(2024, 1, 2)),
+            ]
+        )
+
+        with patch("simple_calendar_service.db.dao.event.EVENT_SEARCH_BACKEND", "memory"):
+            res, has_more = dao.search_events("meeting")
+            self.assertEqual([event.id for event, _ in res], [1])
+            self.assertFalse(has_more)
+
+            # Writes made after the index is built are searchable
+            dao.create_events(events=[Event(id=3, description="Meeting room", time=datetime(2024, 1, 3))])
+            res, _ = dao.search_events("meeting", to_time="2024-01-03T00:00:00")
+            self.assertEqual([event.id for event, _ in res], [1])
+
+            res, _ = dao.search_events("meeting")
+            self.assertEqual([event.id for event, _ in res], [1, 3])
+
+        clear_inverted_indexes()
+
+    def test_sharded_client(self):
+        backends = {name: mongomock.MongoClient(f"mongodb://dao-shard-{name}") for name in ("a", "b")}
+
+        with patch("simple_calendar_service.db.dao.event.MONGODB_SHARDS", "a=mongodb://a;b=mongodb://b"), patch(
+            "simple_calendar_service.db.dao.event.get_shard_clients", return_value=backends
+        ) as get_shard_clients:
+            dao = EventDAO(database="test-db", collection="test-col")
+
+        get_shard_clients.assert_called_once_with({"a": "mongodb://a", "b": "mongodb://b"})
+        self.assertIsInstance(dao.db_client, ShardedMongoDBClient)
+
+        dao.create_events(events=[Event(id=i, time=datetime(2024, 1, i)) for i in range(1, 11)])
+
+        self.assertEqual(dao.get_event_by_id(3).id, 3)
+        self.assertEqual(
+            [event.id for event in dao.get_events_by_time_range("2024-01-02T00:00:00", "2024-01-06T00:00:00")],
+            [2, 3, 4, 5],
+        )
+        self.assertTrue(all(backend["test-db"]["test-col"].count_documents({}) for backend in backends.values()))
@@ -0,0 +1,196 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Event as ThreadEvent
+from unittest.mock import MagicMock
+
+import mongomock
+import pymongo
+
+from simple_calendar_service.db.dao.event import EventDAO
+from simple_calendar_service.db.dao.write_coalescer import (
+    WriteCoalescer,
+    WriteCoalescerClosedError,
+    WriteQueueFullError,
+)
+from simple_calendar_service.db.mongodb_client import MongoDBClient, PartialWriteError
+from simple_calendar_service.dto.event import Event
+
+
+class TestWriteCoalescer(unittest.TestCase):
+
+    @mongomock.patch(servers=(("localhost", 27017),))
+    def setUp(self):
+        client = pymongo.MongoClient(host="localhost", port=27017)
+
+        client["test-db"]["test-collection"].drop()
+
+        self.mongodb_client = MongoDBClient(
+            database="test-db", collection="test-collection"
+        )
+
+    def test_coalesces_concurrent_writes(self):
+        write_coalescer = WriteCoalescer(self.mongodb_client, window_seconds=0.2)
+        self.mongodb_client.execute_write_transaction = MagicMock(
+            wraps=self.mongodb_client.execute_write_transaction
+        )
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(
+                executor.map(
+                    lambda i: write_coalescer.submit([Event(id=i, time=datetime(2024, 1, 1))]),
+                    range(1, 6),
+                )
+            )
+        write_coalescer.close()
+
+        self.mongodb_client.execute_write_transaction.assert_called_once()
+        self.assertFalse(self.mongodb_client.execute_write_transaction.call_args.kwargs["ordered"])
+        self.assertEqual(self.mongodb_client.collection.count_documents({}), 5)
+
+        for i, (res, causal_token) in enumerate(results, start=1):
+            self.assertEqual([record["id"] for record in res["created"]], [i])
+            self.assertEqual(res["updated"], [])
+            self.assertIsNone(causal_token)
+
+    def test_created_and_updated(self):
+        write_coalescer = WriteCoalescer(self.mongodb_client, window_seconds=0)
+
+        write_coalescer.submit([Event(id=1, time=datetime(2024, 1, 1))])
+        res, _ = write_coalescer.submit(
+            [Event(id=1, time=datetime(2024, 1, 2)), Event(id=2, time=datetime(2024, 1, 2))]
+        )
+        write_coalescer.close()
+
+        self.assertEqual([record["id"] for record in res["updated"]], [1])
+        self.assertEqual([record["id"] for record in res["created"]], [2])
+
+    def test_max_batch_size(self):
+        write_coalescer = WriteCoalescer(self.mongodb_client, window_seconds=10, max_batch_size=2)
+
+        # Batch is flushed as soon as it is full rather than waiting for the window
+        res, _ = write_coalescer.submit(
+            [Event(id=1, time=datetime(2024, 1, 1)), Event(id=2, time=datetime(2024, 1, 1))]
+        )
+        write_coalescer.close()
+
+        self.assertEqual(len(res["created"]), 2)
+
+    def test_queue_full(self):
+        writing = ThreadEvent()
+        blocked = ThreadEvent()
+        queued = ThreadEvent()
+
+        def upsert_records(*args, **kwargs):
+            writing.set()
+            blocked.wait(timeout=5)
+            return []
+
+        db_client = MagicMock()
+        db_client.upsert_records.side_effect = upsert_records
+        db_client.causal_token = None
+
+        write_coalescer = WriteCoalescer(db_client, window_seconds=0, max_queue_size=1)
+
+        put_nowait = write_coalescer._queue.put_nowait
+
+        def put_and_notify(item):
+            put_nowait(item)
+            queued.set()
+
+        write_coalescer._queue.put_nowait = put_and_notify
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            # The first write is taken off the queue and blocks in the database, the second fills the queue
+            first = executor.submit(write_coalescer.submit, [Event(id=1, time=datetime(2024, 1, 1))])
+            self.assertTrue(writing.wait(timeout=5))
+            queued.clear()
+            second = executor.submit(write_coalescer.submit, [Event(id=2, time=datetime(2024, 1, 1))])
+            self.assertTrue(queued.wait(timeout=5))
+
+            with self.assertRaises(WriteQueueFullError):
+                write_coalescer.submit([Event(id=3, time=datetime(2024, 1, 1))])
+
+            blocked.set()
+            first.result(timeout=5)
+            second.result(timeout=5)
+
+        write_coalescer.close()
+
+    def test_write_errors_are_raised_to_callers(self):
+        db_client = MagicMock()
+        db_client.upsert_records.side_effect = pymongo.errors.BulkWriteError({})
+
+        write_coalescer = WriteCoalescer(db_client, window_seconds=0)
+
+        with self.assertRaises(pymongo.errors.BulkWriteError):
+            write_coalescer.submit([Event(id=1, time=datetime(2024, 1, 1))])
+
+        write_coalescer.close()
+
+    def test_partial_failure_only_fails_its_callers(self):
+        original_execute_write_transaction = self.mongodb_client.execute_write_transaction
+
+        def execute_write_transaction(queries, collection=None, ordered=True):
+            # The record with _id 2 fails, the rest of the unordered write succeeds
+            failed_index = next((index for index, query in enumerate(queries) if query._filter["_id"] == 2), None)
+            if failed_index is None:
+                return original_execute_write_transaction(queries, collection, ordered=ordered)
+
+            raise pymongo.errors.BulkWriteError(
+                {
+                    "writeErrors": [{"index": failed_index, "code": 11000, "errmsg": "duplicate key"}],
+                    "upserted": [
+                        {"index": index, "_id": query._filter["_id"]}
+                        for index, query in enumerate(queries)
+                        if index != failed_index
+                    ],
+                    "nUpserted": len(queries) - 1,
+                }
+            )
+
+        self.mongodb_client.execute_write_transaction = execute_write_transaction
+        write_coalescer = WriteCoalescer(self.mongodb_client, window_seconds=0.2)
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [
+                executor.submit(write_coalescer.submit, [Event(id=i, time=datetime(2024, 1, 1))]) for i in range(1, 4)
+            ]
+
+            with self.assertRaises(PartialWriteError) as context:
+                futures[1].result(timeout=5)
+            results = [futures[0].result(timeout=5), futures[2].result(timeout=5)]
+        write_coalescer.close()
+
+        self.assertEqual(context.exception.failed_ids, [2])
+        self.assertEqual([[record["id"] for record in res["created"]] for res, _ in results], [[1], [3]])
+
+    def test_close_flushes_pending_writes(self):
+        write_coalescer = WriteCoalescer(self.mongodb_client, window_seconds=10)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = executor.submit(write_coalescer.submit, [Event(id=1, time=datetime(2024, 1, 1))])
+            time.sleep(0.1)
+
+            # The write is flushed on close rather than at the end of its window
+            write_coalescer.close()
+            res, _ = pending.result(timeout=1)
+
+        self.assertEqual(len(res["created"]), 1)
+
+        with self.assertRaises(WriteCoalescerClosedError):
+            write_coalescer.submit([Event(id=2, time=datetime(2024, 1, 1))])
+
+    def test_event_dao(self):
+        write_coalescer = WriteCoalescer(self.mongodb_client, window_seconds=0)
+
+        res = EventDAO(
+            database="test-db",
+            collection="test-collection",
+            client=self.mongodb_client,
+            write_coalescer=write_coalescer,
+        ).create_events(events=[Event(id=1, time=datetime(2024, 1, 1))])
+        write_coalescer.close()
+
+        self.assertEqual(res["created"], [Event(id=1, time=datetime(2024, 1, 1))])
@@ -1,9 +1,24 @@
+import os
+import subprocess
+import sys
 import unittest
+from unittest.mock import MagicMock
+
 import pymongo
 import mongomock
 from datetime import datetime
 
-from simple_calendar_service.db.mongodb_client import MongoDBClient
+from bson import Timestamp
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Primary, SecondaryPreferred
+
+from simple_calendar_service.db.mongodb_client import (
+    InvalidCausalTokenError,
+    MongoDBClient,
+    PartialWriteError,
+    decode_causal_token,
+    validate_read_preference,
+)
 from simple_calendar_service.dto.event import Event
 
 
@@ -114,3 +129,198 @@ class TestMongoDBClient(unittest.TestCase):
             ],
             [2, 3],
         )
+
+    def test_partial_write_error(self):
+        records = [{"_id": i} for i in range(1, 5)]
+        error = pymongo.errors.BulkWriteError(
+            {"writeErrors": [{"index": 1, "code": 11000}], "upserted": [{"index": 0, "_id": 1}], "nUpserted": 1}
+        )
+
+        self.assertEqual(PartialWriteError.from_bulk_write_error(error, records, ordered=False).failed_ids, [2])
+        # An ordered write stops at its first error
+        partial_write_error = PartialWriteError.from_bulk_write_error(error, records, ordered=True)
+        self.assertEqual(partial_write_error.failed_ids, [2, 3, 4])
+        self.assertEqual(partial_write_error.upserted_ids, [1])
+
+    def test_count_documents_by_date_range(self):
+        self.mongodb_client.insert_documents(
+            documents=[Event(id=i, time=datetime(2024, 1, i)) for i in range(1, 6)]
+        )
+
+        self.assertEqual(
+            self.mongodb_client.count_documents_by_date_range(
+                datetime_field="time", datetime_lower=datetime(2024, 1, 2)
+            ),
+            4,
+        )
+        self.assertEqual(
+            self.mongodb_client.count_documents_by_date_range(
+                datetime_field="time", datetime_lower=datetime(2024, 1, 2), limit=2, max_time_ms=1000
+            ),
+            2,
+        )
+
+
+class TestMongoDBClientReadRouting(unittest.TestCase):
+    """
+    Exercises read routing against a mocked replica set topology, as mongomock doesn't support read preferences or
+    sessions
+    """
+
+    def setUp(self):
+        self.client = MagicMock()
+        self.collection = self.client.__getitem__.return_value.__getitem__.return_value
+        self.read_collection = self.collection.with_options.return_value
+
+        self.session = self.client.start_session.return_value
+        self.session.__enter__.return_value = self.session
+        self.session.operation_time = Timestamp(1704067200, 1)
+        self.session.cluster_time = {"clusterTime": Timestamp(1704067200, 1)}
+
+    def test_default_primary_reads(self):
+        mongodb_client = MongoDBClient(database="test-db", collection="test-collection", client=self.client)
+
+        self.assertEqual(mongodb_client.read_preference, Primary())
+        self.assertTrue(mongodb_client.reads_from_primary)
+
+        mongodb_client.get_document(query={"id": 1})
+        self.read_collection.find_one.assert_called_once_with(filter={"id": 1}, session=None)
+
+        mongodb_client.insert_documents(documents=[Event(id=1, time=datetime(2024, 1, 1))])
+        self.collection.bulk_write.assert_called_once()
+        self.client.start_session.assert_not_called()
+        self.assertIsNone(mongodb_client.causal_token)
+
+    def test_secondary_reads_with_max_staleness(self):
+        mongodb_client = MongoDBClient(
+            database="test-db",
+            collection="test-collection",
+            client=self.client,
+            read_preference="secondaryPreferred",
+            max_staleness_seconds=120,
+        )
+
+        self.collection.with_options.assert_called_once_with(
+            read_preference=SecondaryPreferred(max_staleness=120)
+        )
+
+        mongodb_client.get_documents_by_date_range(
+            datetime_field="time", datetime_lower=datetime(2024, 1, 1)
+        )
+        self.read_collection.find.assert_called_once_with(
+            {"time": {"$gte": datetime(2024, 1, 1)}}, session=None
+        )
+        self.collection.find.assert_not_called()
+
+    def test_primary_ignores_max_staleness(self):
+        mongodb_client = MongoDBClient(
+            database="test-db",
+            collection="test-collection",
+            client=self.client,
+            read_preference="primary",
+            max_staleness_seconds=120,
+        )
+
+        self.assertEqual(mongodb_client.read_preference, Primary())
+
+    def test_invalid_read_preference(self):
+        validate_read_preference("secondaryPreferred", 90)
+        validate_read_preference("nearest", -1)
+
+        for mode, max_staleness_seconds in (("secondry", -1), ("secondary", 89), ("secondary", 0)):
+            with self.assertRaises(ValueError):
+                validate_read_preference(mode, max_staleness_seconds)
+
+        # Checked once when the settings are read rather than on every request
+        completed = subprocess.run(
+            [sys.executable, "-c", "import simple_calendar_service.db.mongodb_client"],
+            env={**os.environ, "MONGODB_READ_PREFERENCE": "secondry"},
+            capture_output=True,
+            text=True,
+        )
+        self.assertNotEqual(completed.returncode, 0)
+        self.assertIn("Invalid read preference 'secondry'", completed.stderr)
+
+    def test_read_your_writes(self):
+        writer = MongoDBClient(
+            database="test-db",
+            collection="test-collection",
+            client=self.client,
+            read_preference="secondary",
+        )
+        writer.insert_documents(documents=[Event(id=1, time=datetime(2024, 1, 1))])
+
+        # Writes go to the primary collection within a causal session
+        self.client.start_session.assert_called_once_with(causal_consistency=True)
+        self.assertIs(self.collection.bulk_write.call_args.kwargs["session"], self.session)
+        self.assertEqual(
+            decode_causal_token(writer.causal_token),
+            (self.session.operation_time, self.session.cluster_time),
+        )
+
+        reader = MongoDBClient(
+            database="test-db",
+            collection="test-collection",
+            client=self.client,
+            read_preference="secondary",
+            causal_token=writer.causal_token,
+        )
+        reader.get_document(query={"id": 1})
+
+        self.session.advance_cluster_time.assert_called_once_with(self.session.cluster_time)
+        self.session.advance_operation_time.assert_called_once_with(self.session.operation_time)
+        self.read_collection.with_options.assert_called_once_with(read_concern=ReadConcern("majority"))
+        self.read_collection.with_options.return_value.find_one.assert_called_once_with(
+            filter={"id": 1}, session=self.session
+        )
+        self.session.end_session.assert_called_once()
+
+    def test_invalid_causal_token(self):
+        for token in ("garbage", "Zm9v", "W10=", "e30=", "eyJvcGVyYXRpb25UaW1lIjogMSwgImNsdXN0ZXJUaW1lIjogMn0="):
+            with self.assertRaises(InvalidCausalTokenError):
+                decode_causal_token(token)
+
+        reader = MongoDBClient(
+            database="test-db",
+            collection="test-collection",
+            client=self.client,
+            read_preference="secondary",
+            causal_token="garbage",
+        )
+
+        with self.assertRaises(InvalidCausalTokenError):
+            reader.get_document(query={"id": 1})
+
+    def test_max_time_ms(self):
+        mongodb_client = MongoDBClient(database="test-db", collection="test-collection", client=self.client)
+
+        mongodb_client.get_documents_by_date_range(
+            datetime_field="time", datetime_lower=datetime(2024, 1, 1), max_time_ms=500
+        )
+
+        self.read_collection.find.return_value.max_time_ms.assert_called_once_with(500)
+
+    def test_search_documents(self):
+        mongodb_client = MongoDBClient(database="test-db", collection="test-collection", client=self.client)
+        cursor = self.read_collection.find.return_value.sort.return_value
+        cursor.skip.return_value = cursor
+        cursor.limit.return_value = cursor
+        cursor.max_time_ms.return_value = cursor
+        cursor.__iter__.return_value = iter([{"_id": 1, "score": 1.0}])
+
+        res = mongodb_client.search_documents(
+            "team meeting", "time", datetime_lower=datetime(2024, 1, 1), skip=20, limit=21, max_time_ms=500
+        )
+
+        self.assertEqual(res, [{"_id": 1, "score": 1.0}])
+        self.read_collection.find.assert_called_once_with(
+            {"$text": {"$search": "team meeting"}, "time": {"$gte": datetime(2024, 1, 1)}},
+            {"score": {"$meta": "textScore"}},
+            session=None,
+        )
+        self.read_collection.find.return_value.sort.assert_called_once_with(
+            [("score", {"$meta": "textScore"}), ("time", pymongo.ASCENDING)]
+        )
+        cursor.skip.assert_called_once_with(20)
+        cursor.limit.assert_called_once_with(21)
+        cursor.max_time_ms.assert_called_once_with(500)
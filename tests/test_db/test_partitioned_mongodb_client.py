@@ -0,0 +1,227 @@
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+import mongomock
+import pymongo
+
+from simple_calendar_service.db.mongodb_client import PartialWriteError
+from simple_calendar_service.db.partitioned_mongodb_client import PartitionedMongoDBClient
+from simple_calendar_service.dto.event import Event
+
+
+class TestPartitionedMongoDBClient(unittest.TestCase):
+
+    @mongomock.patch(servers=(("localhost", 27017),))
+    def setUp(self):
+        client = pymongo.MongoClient(host="localhost", port=27017)
+
+        client.drop_database("test-db")
+
+        self.mongodb_client = PartitionedMongoDBClient(
+            database="test-db", collection="events"
+        )
+
+        self.documents = [
+            Event(id=1, time=datetime(2023, 12, 31, 23, 59)),
+            Event(id=2, time=datetime(2024, 1, 15)),
+            Event(id=3, time=datetime(2024, 1, 10)),
+            Event(id=4, time=datetime(2024, 2, 1)),
+            Event(id=5, time=datetime(2024, 3, 20)),
+        ]
+
+    def test_insert_documents(self):
+        res = self.mongodb_client.insert_documents(documents=self.documents)
+
+        self.assertEqual(len(res["created"]), 5)
+        self.assertEqual(
+            self.mongodb_client.list_partitions(),
+            ["events_2023_12", "events_2024_01", "events_2024_02", "events_2024_03"],
+        )
+        self.assertEqual(self.mongodb_client.db["events_2024_01"].count_documents({}), 2)
+
+        res = self.mongodb_client.insert_documents(
+            documents=[Event(id=2, description="updated", time=datetime(2024, 1, 15))]
+        )
+
+        self.assertEqual((len(res["created"]), len(res["updated"])), (0, 1))
+
+    def test_move_between_partitions(self):
+        self.mongodb_client.insert_documents(documents=self.documents)
+
+        res = self.mongodb_client.insert_documents(
+            documents=[Event(id=2, time=datetime(2024, 3, 1))]
+        )
+
+        self.assertEqual((len(res["created"]), len(res["updated"])), (0, 1))
+        self.assertIsNone(self.mongodb_client.db["events_2024_01"].find_one({"_id": 2}))
+        self.assertEqual(self.mongodb_client.get_document(query={"_id": 2})["time"], datetime(2024, 3, 1))
+
+    def test_duplicate_ids_in_one_write(self):
+        self.mongodb_client.insert_documents(
+            documents=[Event(id=1, time=datetime(2024, 1, 5)), Event(id=1, time=datetime(2024, 2, 5))]
+        )
+
+        # Only the last version is kept, as in an unpartitioned collection
+        res = list(
+            self.mongodb_client.get_documents_by_date_range(datetime_field="time", datetime_lower=datetime(2024, 1, 1))
+        )
+        self.assertEqual([document["time"] for document in res], [datetime(2024, 2, 5)])
+        self.assertIsNone(self.mongodb_client.db["events_2024_01"].find_one({"_id": 1}))
+        self.assertEqual(self.mongodb_client.partition_index.find_one({"_id": 1})["partition"], "events_2024_02")
+
+    def test_move_interrupted_before_cleanup(self):
+        self.mongodb_client.insert_documents(documents=self.documents)
+
+        with patch.object(
+            mongomock.collection.Collection, "delete_many", side_effect=pymongo.errors.AutoReconnect("connection lost")
+        ):
+            with self.assertRaises(pymongo.errors.AutoReconnect):
+                self.mongodb_client.insert_documents(documents=[Event(id=2, time=datetime(2024, 3, 1))])
+
+        # The index already points at the new copy, so the event can still be fetched by id
+        self.assertEqual(self.mongodb_client.get_document(query={"_id": 2})["time"], datetime(2024, 3, 1))
+
+    def test_partial_write_error(self):
+        upsert_records_into = self.mongodb_client.upsert_records_into
+
+        def fail_february(collection, records, ordered=True):
+            if collection.name == "events_2024_02":
+                raise PartialWriteError("duplicate key", failed_ids=[record["_id"] for record in records], upserted_ids=[])
+            return upsert_records_into(collection, records, ordered=ordered)
+
+        with patch.object(self.mongodb_client, "upsert_records_into", side_effect=fail_february):
+            with self.assertRaises(PartialWriteError) as context:
+                self.mongodb_client.upsert_records(
+                    [document.convert_to_mongodb_record() for document in self.documents], ordered=False
+                )
+
+        self.assertEqual(context.exception.failed_ids, [4])
+        self.assertEqual(sorted(context.exception.upserted_ids), [1, 2, 3, 5])
+        # Only written records are indexed
+        self.assertEqual(sorted(entry["_id"] for entry in self.mongodb_client.partition_index.find()), [1, 2, 3, 5])
+
+    def test_get_document(self):
+        self.mongodb_client.insert_documents(documents=self.documents)
+
+        self.assertEqual(self.mongodb_client.get_document(query={"_id": 3})["id"], 3)
+        self.assertEqual(self.mongodb_client.get_document(query={"id": 1})["id"], 1)
+        self.assertIsNone(self.mongodb_client.get_document(query={"_id": 100}))
+
+    def test_get_documents_by_date_range(self):
+        self.mongodb_client.insert_documents(documents=self.documents)
+
+        with patch.object(
+            self.mongodb_client, "_iterate_partitions", wraps=self.mongodb_client._iterate_partitions
+        ) as iterate_partitions:
+            res = self.mongodb_client.get_documents_by_date_range(
+                datetime_field="time",
+                datetime_lower=datetime(2024, 1, 1),
+                datetime_upper=datetime(2024, 3, 1),
+            )
+
+            self.assertEqual([document["id"] for document in res], [3, 2, 4])
+            # Only partitions overlapping the range are queried
+            self.assertEqual(iterate_partitions.call_args.args[0], ["events_2024_01", "events_2024_02"])
+
+        self.assertEqual(
+            [
+                document["id"]
+                for document in self.mongodb_client.get_documents_by_date_range(
+                    datetime_field="time", datetime_upper=datetime(2024, 1, 12)
+                )
+            ],
+            [1, 3],
+        )
+
+        with self.assertRaises(ValueError):
+            self.mongodb_client.get_documents_by_date_range(datetime_field="time")
+
+    def test_count_documents_by_date_range(self):
+        self.mongodb_client.insert_documents(documents=self.documents)
+
+        self.assertEqual(
+            self.mongodb_client.count_documents_by_date_range(
+                datetime_field="time", datetime_lower=datetime(2024, 1, 1)
+            ),
+            4,
+        )
+        self.assertEqual(
+            self.mongodb_client.count_documents_by_date_range(
+                datetime_field="time", datetime_lower=datetime(2024, 1, 1), limit=3, max_time_ms=1000
+            ),
+            3,
+        )
+
+    def test_max_time_ms_spans_partitions(self):
+        self.mongodb_client.insert_documents(documents=self.documents)
+
+        res = self.mongodb_client.get_documents_by_date_range(
+            datetime_field="time", datetime_lower=datetime(2024, 1, 1), max_time_ms=1000
+        )
+
+        self.assertEqual(next(res)["id"], 3)
+
+        # The time limit covers the whole query, not each partition
+        with patch("simple_calendar_service.db.partitioned_mongodb_client.time.monotonic", return_value=10**9):
+            with self.assertRaises(pymongo.errors.ExecutionTimeout):
+                list(res)
+
+    def test_search_documents(self):
+        self.mongodb_client.insert_documents(documents=self.documents)
+
+        # mongomock doesn't support $text queries, each partition returns its top results by score
+        partition_results = {
+            "events_2024_01": [{"id": 3, "time": datetime(2024, 1, 10), "score": 2.0},
+                               {"id": 2, "time": datetime(2024, 1, 15), "score": 0.5}],
+            "events_2024_02": [{"id": 4, "time": datetime(2024, 2, 1), "score": 1.0}],
+            "events_2024_03": [{"id": 5, "time": datetime(2024, 3, 20), "score": 1.0}],
+        }
+
+        with patch.object(
+            self.mongodb_client,
+            "search_documents_in",
+            side_effect=lambda collection, *args, **kwargs: partition_results[collection.name],
+        ) as search_documents_in:
+            res = self.mongodb_client.search_documents(
+                "test", "time", datetime_lower=datetime(2024, 1, 1), skip=1, limit=2
+            )
+
+        self.assertEqual([document["id"] for document in res], [4, 5])
+        # Partitions outside the range are pruned, and each returns enough results to fill the requested page
+        self.assertEqual(search_documents_in.call_count, 3)
+        self.assertTrue(all(call.kwargs["limit"] == 3 for call in search_documents_in.call_args_list))
+
+    def test_partitions_for_range(self):
+        self.mongodb_client.insert_documents(documents=self.documents)
+
+        self.assertEqual(
+            self.mongodb_client.partitions_for_range(datetime(2023, 12, 31), datetime(2024, 1, 1)),
+            ["events_2023_12"],
+        )
+        self.assertEqual(
+            self.mongodb_client.partitions_for_range(datetime(2024, 2, 15), None),
+            ["events_2024_02", "events_2024_03"],
+        )
+
+    def test_drop_partitions_before(self):
+        self.mongodb_client.insert_documents(documents=self.documents)
+
+        dropped = self.mongodb_client.drop_partitions_before(datetime(2024, 2, 15))
+
+        self.assertEqual(dropped, ["events_2023_12", "events_2024_01"])
+        self.assertEqual(self.mongodb_client.list_partitions(), ["events_2024_02", "events_2024_03"])
+        self.assertIsNone(self.mongodb_client.get_document(query={"_id": 2}))
+        self.assertEqual(self.mongodb_client.partition_index.count_documents({}), 2)
+
+    def test_migrate_from_collection(self):
+        self.mongodb_client.collection.insert_many(
+            [document.convert_to_mongodb_record() for document in self.documents]
+        )
+
+        migrated = self.mongodb_client.migrate_from_collection(batch_size=2, drop_source=True)
+
+        self.assertEqual(migrated, 5)
+        self.assertEqual(len(self.mongodb_client.list_partitions()), 4)
+        self.assertNotIn("events", self.mongodb_client.db.list_collection_names())
+        self.assertEqual(self.mongodb_client.get_document(query={"_id": 5})["id"], 5)
@@ -0,0 +1,53 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime
+from unittest.mock import patch
+
+import mongomock
+
+from simple_calendar_service.db import partitions
+from simple_calendar_service.dto.event import Event
+
+
+class TestPartitionsCommand(unittest.TestCase):
+
+    def setUp(self):
+        self.backends = {
+            name: mongomock.MongoClient(f"mongodb://partitions-{name}") for name in ("a", "b")
+        }
+        for backend in self.backends.values():
+            backend.drop_database("test-db")
+
+        patch.dict("os.environ", {"MONGODB_DATABASE": "test-db", "MONGODB_EVENTS_COLLECTION_NAME": "events"}).start()
+        patch.object(partitions, "MONGODB_SHARDS", "a=mongodb://partitions-a;b=mongodb://partitions-b").start()
+        patch.object(partitions, "get_shard_clients", return_value=self.backends).start()
+        self.addCleanup(patch.stopall)
+
+    def run_command(self, *argv) -> str:
+        output = io.StringIO()
+        with redirect_stdout(output):
+            partitions.main(list(argv))
+
+        return output.getvalue()
+
+    def test_every_shard(self):
+        clients = partitions.get_partitioned_clients()
+        self.assertEqual(set(clients), {"a", "b"})
+
+        for name, client in clients.items():
+            # Unpartitioned events left in each shard's collection
+            client.collection.insert_many(
+                [
+                    Event(id=i, time=datetime(2023 + i % 2, 1, 1)).convert_to_mongodb_record()
+                    for i in range(1, 5)
+                    if (i % 2 == 0) == (name == "a")
+                ]
+            )
+
+        self.assertEqual(self.run_command("migrate").splitlines(), ["a: Migrated 2 events", "b: Migrated 2 events"])
+        self.assertEqual(self.run_command("list").splitlines(), ["a: events_2023_01", "b: events_2024_01"])
+        self.assertEqual(
+            self.run_command("drop-before", "2024-01-01T00:00:00").splitlines(), ["a: Dropped events_2023_01"]
+        )
+        self.assertEqual(self.run_command("list").splitlines(), ["b: events_2024_01"])
@@ -0,0 +1,228 @@
+import unittest
+from collections import Counter
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+
+import mongomock
+from bson import Timestamp
+
+from simple_calendar_service.db.mongodb_client import InvalidCausalTokenError, MongoDBClient, encode_causal_token
+from simple_calendar_service.db.partitioned_mongodb_client import PartitionedMongoDBClient
+from simple_calendar_service.db.sharded_mongodb_client import (
+    HashRing,
+    ShardedMongoDBClient,
+    decode_sharded_causal_token,
+    encode_sharded_causal_token,
+    parse_shards,
+)
+from simple_calendar_service.dto.event import Event
+from simple_calendar_service.profiling import PROFILER
+
+
+class TestHashRing(unittest.TestCase):
+
+    def test_distribution(self):
+        ring = HashRing(["a", "b", "c"])
+
+        counts = Counter(ring.get_shard(key) for key in range(3000))
+
+        self.assertEqual(set(counts), {"a", "b", "c"})
+        self.assertTrue(all(count > 600 for count in counts.values()))
+
+    def test_adding_shard_moves_few_keys(self):
+        ring = HashRing(["a", "b", "c"])
+        grown_ring = HashRing(["a", "b", "c", "d"])
+
+        moved = [key for key in range(3000) if ring.get_shard(key) != grown_ring.get_shard(key)]
+
+        # Only keys taken over by the new shard move
+        self.assertTrue(all(grown_ring.get_shard(key) == "d" for key in moved))
+        self.assertLess(len(moved), 1200)
+
+    def test_parse_shards(self):
+        self.assertEqual(
+            parse_shards("a=mongodb://mongo-a:27017,mongo-b:27017/?replicaSet=rs0; b=mongodb://mongo-c:27017;"),
+            {"a": "mongodb://mongo-a:27017,mongo-b:27017/?replicaSet=rs0", "b": "mongodb://mongo-c:27017"},
+        )
+
+        with self.assertRaises(ValueError):
+            parse_shards("mongodb://mongo-a:27017")
+
+        with self.assertRaises(ValueError):
+            parse_shards("a=mongodb://mongo-a:27017;a=mongodb://mongo-b:27017")
+
+
+class TestShardedMongoDBClient(unittest.TestCase):
+
+    def setUp(self):
+        self.backends = {
+            name: mongomock.MongoClient(f"mongodb://shard-{name}") for name in ("a", "b", "c")
+        }
+        for backend in self.backends.values():
+            backend.drop_database("test-db")
+
+        self.mongodb_client = ShardedMongoDBClient(
+            database="test-db", collection="events", shards=self.backends
+        )
+
+        # Ids start at 1 as mongomock doesn't report an upserted _id of 0
+        self.documents = [
+            Event(id=i, description=f"event {i}", time=datetime(2024, 1, 1 + (i * 7) % 28))
+            for i in range(1, 31)
+        ]
+
+    def shard_ids(self, name):
+        return {document["_id"] for document in self.backends[name]["test-db"]["events"].find()}
+
+    def test_insert_documents(self):
+        res = self.mongodb_client.insert_documents(documents=self.documents)
+
+        self.assertEqual(len(res["created"]), 30)
+
+        # Every shard holds exactly the documents the ring assigns to it
+        for name in self.backends:
+            self.assertEqual(
+                self.shard_ids(name),
+                {i for i in range(1, 31) if self.mongodb_client.ring.get_shard(i) == name},
+            )
+            self.assertTrue(self.shard_ids(name))
+
+        res = self.mongodb_client.insert_documents(documents=self.documents[:3])
+
+        self.assertEqual((len(res["created"]), len(res["updated"])), (0, 3))
+
+    def test_get_document(self):
+        self.mongodb_client.insert_documents(documents=self.documents)
+
+        for shard in self.mongodb_client.shards.values():
+            patch.object(shard, "get_document", wraps=shard.get_document).start()
+        self.addCleanup(patch.stopall)
+
+        self.assertEqual(self.mongodb_client.get_document({"_id": 7})["description"], "event 7")
+
+        # Only the owning shard is queried
+        owner = self.mongodb_client.get_shard(7)
+        for shard in self.mongodb_client.shards.values():
+            self.assertEqual(shard.get_document.call_count, 1 if shard is owner else 0)
+
+        self.assertEqual(self.mongodb_client.get_document({"description": "event 8"})["_id"], 8)
+        self.assertIsNone(self.mongodb_client.get_document({"_id": 100}))
+
+    def test_get_documents_by_date_range(self):
+        self.mongodb_client.insert_documents(documents=self.documents)
+
+        res = list(
+            self.mongodb_client.get_documents_by_date_range(
+                datetime_field="time",
+                datetime_lower=datetime(2024, 1, 8),
+                datetime_upper=datetime(2024, 1, 22),
+            )
+        )
+
+        expected = sorted(
+            (event for event in self.documents if datetime(2024, 1, 8) <= event.time < datetime(2024, 1, 22)),
+            key=lambda event: event.time,
+        )
+        self.assertEqual([document["time"] for document in res], [event.time for event in expected])
+        self.assertEqual({document["id"] for document in res}, {event.id for event in expected})
+
+        self.assertEqual(
+            self.mongodb_client.count_documents_by_date_range(
+                datetime_field="time", datetime_lower=datetime(2024, 1, 8), datetime_upper=datetime(2024, 1, 22)
+            ),
+            len(expected),
+        )
+
+    @patch("simple_calendar_service.db.mongodb_client._SORT_INDEXED_COLLECTIONS", set())
+    def test_partitioned_shards(self):
+        mongodb_client = ShardedMongoDBClient(
+            database="test-db",
+            collection="events",
+            shards=self.backends,
+            shard_client_class=PartitionedMongoDBClient,
+        )
+        mongodb_client.insert_documents(
+            documents=[Event(id=i, time=datetime(2024, 1 + i % 3, 1 + i)) for i in range(1, 13)]
+        )
+
+        res = list(mongodb_client.get_documents_by_date_range(datetime_field="time", datetime_lower=datetime(2024, 1, 1)))
+
+        self.assertEqual(len(res), 12)
+        self.assertEqual([document["time"] for document in res], sorted(document["time"] for document in res))
+        self.assertEqual(mongodb_client.get_document({"_id": 5})["id"], 5)
+
+        # Only partitions are created, not the unpartitioned collection
+        for backend in self.backends.values():
+            self.assertNotIn("events", backend["test-db"].list_collection_names())
+
+    @patch("simple_calendar_service.db.mongodb_client._SORT_INDEXED_COLLECTIONS", set())
+    def test_sort_index(self):
+        self.mongodb_client.insert_documents(documents=self.documents)
+
+        for backend in self.backends.values():
+            indexes = backend["test-db"]["events"].index_information().values()
+            self.assertIn([("time", 1)], [index["key"] for index in indexes])
+
+    def test_causal_token(self):
+        tokens = {
+            name: encode_causal_token(
+                MagicMock(operation_time=Timestamp(1704067200, i), cluster_time={"clusterTime": Timestamp(1704067200, i)})
+            )
+            for i, name in enumerate(("a", "c"), start=1)
+        }
+        for name, shard in self.mongodb_client.shards.items():
+            shard.causal_token = tokens.get(name)
+
+        reader = ShardedMongoDBClient(
+            database="test-db",
+            collection="events",
+            shards=self.backends,
+            causal_token=self.mongodb_client.causal_token,
+        )
+
+        # Each shard is handed its part of the token when the reader is first used
+        reader.get_document({"_id": 1})
+
+        self.assertEqual(
+            {name: shard.causal_token for name, shard in reader.shards.items()},
+            {"a": tokens["a"], "b": None, "c": tokens["c"]},
+        )
+        self.assertIsNone(
+            ShardedMongoDBClient(database="test-db", collection="events", shards=self.backends).causal_token
+        )
+
+    def test_invalid_causal_token(self):
+        valid_token = encode_causal_token(
+            MagicMock(operation_time=Timestamp(1704067200, 1), cluster_time={"clusterTime": Timestamp(1704067200, 1)})
+        )
+
+        for token in ("garbage", "W10=", encode_sharded_causal_token({"a": "garbage"}), valid_token):
+            with self.assertRaises(InvalidCausalTokenError):
+                decode_sharded_causal_token(token)
+
+            # Malformed tokens only raise once a query uses them
+            reader = ShardedMongoDBClient(
+                database="test-db", collection="events", shards=self.backends, causal_token=token
+            )
+            with self.assertRaises(InvalidCausalTokenError):
+                reader.get_document({"_id": 1})
+
+    def test_profiled_shard_queries(self):
+        self.mongodb_client.insert_documents(documents=self.documents)
+
+        with patch.object(PROFILER, "_instrumented_classes", [MongoDBClient]):
+            PROFILER.start(mode="cprofile")
+            self.addCleanup(PROFILER.stop)
+
+            PROFILER.begin_request("GET /events")
+            res = list(
+                self.mongodb_client.get_documents_by_date_range(
+                    datetime_field="time", datetime_lower=datetime(2024, 1, 1)
+                )
+            )
+            PROFILER.end_request()
+            PROFILER.stop()
+
+        self.assertEqual(len(res), 30)
+        # Each shard is queried from a pool thread, which times its stage for the request
+        self.assertEqual(PROFILER.report()["stages"]["MongoDBClient.get_documents_by_date_range"]["calls"], 3)
@@ -0,0 +1,119 @@
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from simple_calendar_service import profiling
+from simple_calendar_service.profiling import Profiler
+
+
+class Stage:
+    def work(self):
+        time.sleep(0.05)
+        return "done"
+
+    def items(self):
+        for item in range(2):
+            time.sleep(0.05)
+            yield item
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.profiler = Profiler()
+        self.profiler.instrument(Stage)
+
+    def tearDown(self):
+        self.profiler.stop()
+
+    def test_inactive(self):
+        original = Stage.work
+
+        self.profiler.begin_request("GET /test")
+        self.assertFalse(self.profiler.profiling_request)
+        self.assertIs(Stage.work, original)
+
+    def test_sampler(self):
+        with mock.patch.object(profiling, "PROFILING_SAMPLE_INTERVAL_MS", 1):
+            self.profiler.start(mode="sampler", requests=1)
+
+            self.profiler.begin_request("GET /test")
+            self.assertEqual(Stage().work(), "done")
+            self.profiler.end_request()
+
+        report = self.profiler.report()
+        self.assertEqual(report["stages"]["Stage.work"]["calls"], 1)
+        self.assertGreaterEqual(report["stages"]["Stage.work"]["total_ms"], 50)
+        self.assertIn("test_profiling.py:Stage.work", self.profiler.folded())
+
+    def test_stages_only_recorded_for_profiled_requests(self):
+        self.profiler.start(mode="cprofile")
+
+        Stage().work()
+        self.assertEqual(self.profiler.report()["stages"], {})
+
+    def test_sample_rate(self):
+        self.profiler.start(sample_rate=0.5)
+
+        with mock.patch("simple_calendar_service.profiling.random.random", side_effect=[0.9, 0.1]):
+            self.profiler.begin_request("GET /test")
+            self.assertFalse(self.profiler.profiling_request)
+
+            self.profiler.begin_request("GET /test")
+            self.assertTrue(self.profiler.profiling_request)
+            self.profiler.end_request()
+
+        self.assertEqual(self.profiler.report()["profiled_requests"], 1)
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            self.profiler.start(mode="perf")
+        with self.assertRaises(ValueError):
+            self.profiler.start(sample_rate=0)
+        with self.assertRaises(ValueError):
+            self.profiler.start(requests=0)
+
+    def test_iterator_consumption_timed(self):
+        self.profiler.start(mode="cprofile")
+
+        self.profiler.begin_request("GET /test")
+        items = Stage().items()
+
+        # Nothing has run until the generator is consumed
+        self.assertNotIn("Stage.items", self.profiler.report()["stages"])
+
+        self.assertEqual(list(items), [0, 1])
+        self.profiler.end_request()
+
+        stage = self.profiler.report()["stages"]["Stage.items"]
+        self.assertEqual(stage["calls"], 1)
+        self.assertGreaterEqual(stage["total_ms"], 100)
+
+    def test_iterator_closed_early(self):
+        self.profiler.start(mode="cprofile")
+
+        self.profiler.begin_request("GET /test")
+        items = Stage().items()
+        self.assertEqual(next(items), 0)
+        items.close()
+        self.profiler.end_request()
+
+        stage = self.profiler.report()["stages"]["Stage.items"]
+        self.assertEqual(stage["calls"], 1)
+        self.assertGreaterEqual(stage["total_ms"], 50)
+
+    def test_propagate(self):
+        with mock.patch.object(profiling, "PROFILING_SAMPLE_INTERVAL_MS", 1):
+            self.profiler.start(mode="sampler")
+
+            self.profiler.begin_request("GET /test")
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                work = self.profiler.propagate(lambda stage: stage.work())
+                self.assertEqual(list(executor.map(work, [Stage(), Stage()])), ["done", "done"])
+                # Threads only profile work done for a profiled request
+                executor.submit(lambda: Stage().work()).result()
+            self.profiler.end_request()
+
+        self.assertEqual(self.profiler.report()["stages"]["Stage.work"]["calls"], 2)
+        self.assertIn("test_profiling.py:Stage.work", self.profiler.folded())
+        self.assertFalse(self.profiler.profiling_request)
@@ -0,0 +1,72 @@
+import unittest
+from datetime import datetime
+
+from simple_calendar_service.search.inverted_index import (
+    InvertedIndex,
+    clear_inverted_indexes,
+    get_inverted_index,
+    tokenize,
+)
+
+
+class TestInvertedIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = InvertedIndex(text_field="description", datetime_field="time")
+        self.index.add_documents(
+            [
+                {"_id": 1, "id": 1, "description": "Team meeting", "time": datetime(2024, 1, 1)},
+                {"_id": 2, "id": 2, "description": "Dentist", "time": datetime(2024, 1, 2)},
+                {"_id": 3, "id": 3, "description": "Meeting about the team meeting", "time": datetime(2024, 1, 3)},
+                {"_id": 4, "id": 4, "description": "Lunch with team", "time": datetime(2024, 1, 4)},
+                {"_id": 5, "id": 5, "description": None, "time": datetime(2024, 1, 5)},
+            ]
+        )
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Team-meeting, 10AM!"), ["team", "meeting", "10am"])
+        self.assertEqual(tokenize(None), [])
+
+    def test_search_ranking(self):
+        res = self.index.search("meeting")
+
+        self.assertEqual([document["id"] for document in res], [3, 1])
+        self.assertGreater(res[0]["score"], res[1]["score"])
+
+        # Documents matching any term are returned, rarer terms score higher and ties are ordered by time
+        self.assertEqual([document["id"] for document in self.index.search("lunch team")], [4, 1, 3])
+        self.assertEqual(self.index.search("holiday"), [])
+
+    def test_search_time_range(self):
+        res = self.index.search("team", datetime_lower=datetime(2024, 1, 2), datetime_upper=datetime(2024, 1, 4))
+
+        self.assertEqual([document["id"] for document in res], [3])
+
+    def test_pagination(self):
+        self.assertEqual([document["id"] for document in self.index.search("team meeting", limit=2)], [3, 1])
+        self.assertEqual([document["id"] for document in self.index.search("team meeting", skip=2, limit=2)], [4])
+
+    def test_replace_and_remove(self):
+        self.index.add_documents(
+            [{"_id": 2, "id": 2, "description": "Team dentist", "time": datetime(2024, 1, 2)}]
+        )
+        self.assertIn(2, [document["id"] for document in self.index.search("team")])
+
+        self.index.remove_document(2)
+        self.assertEqual(self.index.search("dentist"), [])
+        self.assertEqual(len(self.index), 4)
+
+    def test_get_inverted_index(self):
+        clear_inverted_indexes()
+        loads = []
+
+        def load_documents():
+            loads.append(True)
+            return [{"_id": 1, "description": "Team meeting", "time": datetime(2024, 1, 1)}]
+
+        index = get_inverted_index(("test-db", "test-collection"), "description", "time", load_documents)
+
+        self.assertIs(get_inverted_index(("test-db", "test-collection"), "description", "time", load_documents), index)
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(len(index), 1)
+
+        clear_inverted_indexes()